@@ -1,13 +1,53 @@
 import logging
 from datetime import datetime, timedelta
 from airflow.decorators import dag, task
+from airflow.exceptions import AirflowSkipException
+from airflow.models.param import Param
 from airflow.providers.mongo.hooks.mongo import MongoHook
 from airflow.providers.postgres.hooks.postgres import PostgresHook
-import json
-import csv
 from airflow.providers.mysql.hooks.mysql import MySqlHook
-import re
 
+from warehouse.backfill import BackfillLoader
+from warehouse.checkpoints import checkpoint_key
+from warehouse.extract import (
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_MONGO_CURSOR_BATCH_SIZE,
+    POSTGRES_JOURNALS_COLUMNS,
+    iter_mongo_chunks,
+    iter_postgres_chunks,
+    make_window,
+    mongo_high_watermark,
+    mongo_window_query,
+    postgres_high_watermark,
+)
+from warehouse.files import (
+    DEFAULT_CSV_PATTERN,
+    DEFAULT_JSON_PATTERN,
+    expand_paths,
+    files_high_watermark,
+    iter_csv_records,
+    iter_file_chunks,
+    iter_json_records,
+    modified_in,
+)
+from warehouse.loader import DEFAULT_BATCH_SIZE, DEFAULT_COMMIT_EVERY, WarehouseLoader
+from warehouse.metrics import PipelineMetrics, sample_payload
+from warehouse.quarantine import ensure_quarantine, fetch_quarantine, mark_replayed, pending_quarantine
+from warehouse.staging import (
+    DEFAULT_STAGING_DIR,
+    read_chunks,
+    remove_staged,
+    split_manifest,
+    staging_path,
+    write_chunks,
+)
+from warehouse.transform import DEFAULT_TRANSFORM_WORKERS, transform_chunk, transform_parallel
+from warehouse.watermarks import get_watermark, set_watermark
+
+
+# Partitions de chargement par source; au-delà, les workers sont saturés
+# et les tâches se disputent les verrous des tables de dimensions
+DEFAULT_LOAD_PARTITIONS = 4
 
 default_args = {
     'owner': 'admin',
@@ -21,11 +61,96 @@ default_args = {
     dag_id='pipeline',
     schedule_interval='@daily',
     start_date=datetime(2023, 12, 28),
-    catchup=False
+    catchup=False,
+    params={
+        # Nombre de publications écrites par lot
+        'batch_size': Param(DEFAULT_BATCH_SIZE, type='integer', minimum=1),
+        # Nombre de lots validés par transaction
+        'commit_every': Param(DEFAULT_COMMIT_EVERY, type='integer', minimum=1),
+        # "batched": INSERT multi-lignes par lots, "backfill": LOAD DATA LOCAL INFILE
+        # dans des tables de staging puis fusion (premier chargement, réimports massifs)
+        'load_mode': Param('batched', enum=['batched', 'backfill']),
+        # Processus de normalisation par tâche de chargement (1: dans le processus de la tâche)
+        'transform_workers': Param(DEFAULT_TRANSFORM_WORKERS, type='integer', minimum=1),
+        # "files": les morceaux extraits sont écrits dans `staging_dir` et seul
+        # leur manifeste transite par XCom,
+        # "stream": les sources sont lues en flux par une seule tâche de chargement,
+        # "materialize": les données complètes transitent par XCom
+        'extract_mode': Param('files', enum=['files', 'stream', 'materialize']),
+        # Nombre d'enregistrements par morceau transmis au chargeur
+        'chunk_size': Param(DEFAULT_CHUNK_SIZE, type='integer', minimum=1),
+        'staging_dir': Param(DEFAULT_STAGING_DIR, type='string'),
+        # Nombre maximal de tâches de chargement parallèles par source
+        'load_partitions': Param(DEFAULT_LOAD_PARTITIONS, type='integer', minimum=1),
+        # Conserver les fichiers de staging après le chargement (débogage)
+        'keep_staging_files': Param(False, type='boolean'),
+        # Motifs glob des fichiers sources (``**`` récursif, .gz accepté)
+        'json_path_pattern': Param(DEFAULT_JSON_PATTERN, type='string'),
+        'csv_path_pattern': Param(DEFAULT_CSV_PATTERN, type='string'),
+        'mongo_cursor_batch_size': Param(DEFAULT_MONGO_CURSOR_BATCH_SIZE, type='integer', minimum=1),
+        # Champs servant de watermark pour l'extraction incrémentale (un champ
+        # de date de mise à jour permet aussi de reprendre les enregistrements modifiés)
+        'mongo_watermark_field': Param('_id', type='string'),
+        'postgres_watermark_column': Param(POSTGRES_JOURNALS_COLUMNS[0], type='string'),
+        # Ignorer les watermarks et réextraire toutes les sources
+        'full_refresh': Param(False, type='boolean'),
+        # Fraction des enregistrements bruts journalisés en entier (débogage, coûteux)
+        'payload_sample_rate': Param(0, type='number', minimum=0, maximum=1),
+        # Rejouer les enregistrements en quarantaine après les chargements
+        'replay_quarantine': Param(False, type='boolean'),
+    },
 )
 def pipeline():
+    def extraction_window(source, field, high, params):
+        """Fenêtre ]dernier watermark, high] à extraire, ou None s'il n'y a rien de nouveau."""
+        if high is None:
+            logging.info(f"Source '{source}' is empty.")
+            return None
+        low = None if params['full_refresh'] else get_watermark(source, field)
+        window = make_window(field, low, high)
+        if window['low'] == window['high']:
+            logging.info(f"No new records in '{source}' since {field} = {low}.")
+            return None
+        logging.info(f"Extracting '{source}' where {low} < {field} <= {window['high']}.")
+        return window
+
+    def hand_off(source, window, chunks, params, run_id, schema=None):
+        """Transmettre les morceaux extraits au chargeur selon `extract_mode`.
+
+        Retourne la liste des partitions sur laquelle la tâche de chargement de
+        la source est dupliquée (`.expand`), au plus `load_partitions`. En mode
+        "files", les morceaux sont écrits dans le répertoire de staging et seul
+        leur manifeste transite par XCom; en mode "materialize", les
+        enregistrements eux-mêmes transitent par XCom.
+        """
+        metrics = PipelineMetrics(run_id=run_id, task_id=f'fetch_data_from_{source}', source=source)
+        chunks = metrics.timed('extract', chunks)
+        try:
+            if params['extract_mode'] == 'files':
+                directory = staging_path(params['staging_dir'], run_id, source)
+                with metrics.stage('stage_write') as stage:
+                    manifest = write_chunks(chunks, directory, schema)
+                    stage.count(rows_in=manifest['rows'], rows_out=manifest['rows'],
+                                bytes=sum(file['bytes'] for file in manifest['files']))
+                return [
+                    {'source': source, 'window': window, 'manifest': partition}
+                    for partition in split_manifest(manifest, params['load_partitions'])
+                ]
+
+            records = [record for chunk in chunks for record in chunk]
+            logging.info(f"Fetched {len(records)} records from '{source}'.")
+            if not records:
+                return []
+            size = -(-len(records) // params['load_partitions'])  # Arrondi supérieur
+            return [
+                {'source': source, 'window': window, 'records': records[start:start + size]}
+                for start in range(0, len(records), size)
+            ]
+        finally:
+            metrics.publish(MySqlHook(mysql_conn_id="mysql_default"))
+
     @task()
-    def fetch_data_from_mongo():
+    def fetch_data_from_mongo(params=None, run_id=None):
         try:
             # Initialize the Mongo hook and get the MongoDB connection
             hook = MongoHook(mongo_conn_id='mongo_default')
@@ -34,321 +159,241 @@ def pipeline():
             # Access your MongoDB database and collection
             collection = client['bigdata']['journals']
 
-            # Fetch data from the collection
-            cursor = collection.find()  # This returns a cursor to iterate over the documents
+            # Only documents added or changed since the last successful load are extracted
+            field = params['mongo_watermark_field']
+            window = extraction_window('mongo', field, mongo_high_watermark(collection, field), params)
+            if window is None:
+                return []
 
-            # Convert the documents to a list of dictionaries and serialize ObjectId
-            data_list = []
-            for document in cursor:
-                document['_id'] = str(document['_id'])  # Convert ObjectId to string
-                data_list.append(document)
+            # En mode "stream", seul un descripteur transite par XCom: la tâche de
+            # chargement lit la collection elle-même, morceau par morceau
+            if params['extract_mode'] == 'stream':
+                return [{'source': 'mongo', 'stream': True, 'window': window}]
 
-            # Print the data in JSON format
-            print(json.dumps(data_list, indent=4))  # Pretty print the JSON
-             
-            return data_list  # This can be returned if needed for further tasks
+            # Fetch only the fields read by the loader
+            chunks = iter_mongo_chunks(collection, chunk_size=params['chunk_size'],
+                                       cursor_batch_size=params['mongo_cursor_batch_size'],
+                                       query=mongo_window_query(window))
+            return hand_off('mongo', window, chunks, params, run_id)
 
         except Exception as e:
             print(f"Error connecting to MongoDB: {e}")
-            return None
+            return []
 
     @task()
-    def fetch_data_from_postgres():
+    def fetch_data_from_postgres(params=None, run_id=None):
         try:
             # Initialize the Postgres hook
             postgres_hook = PostgresHook(postgres_conn_id='postgres_default')
-
-            # SQL query to fetch data from users table
-            sql_query = "SELECT * FROM journals;"
-
-            # Execute the query
             connection = postgres_hook.get_conn()
-            cursor = connection.cursor()
-            cursor.execute(sql_query)
-
-            # Fetch and print the data
-            data = cursor.fetchall()
-            for row in data:
-                print(row)
 
-            return data  # Return data for potential further processing
+            try:
+                # Only rows added or changed since the last successful load are extracted
+                field = params['postgres_watermark_column']
+                window = extraction_window('postgres', field, postgres_high_watermark(connection, field), params)
+                if window is None:
+                    return []
+
+                # En mode "stream", la tâche de chargement lit la table via un curseur côté serveur
+                if params['extract_mode'] == 'stream':
+                    return [{'source': 'postgres', 'stream': True, 'window': window}]
+
+                # Fetch the journals table chunk by chunk through a server-side cursor
+                chunks = iter_postgres_chunks(connection, params['chunk_size'], window=window)
+                return hand_off('postgres', window, chunks, params, run_id, schema=POSTGRES_JOURNALS_COLUMNS)
+            finally:
+                connection.close()
 
         except Exception as e:
             print(f"Error connecting to PostgreSQL: {e}")
-            return None
+            return []
 
-    @task()
-    def fetch_data_from_json():
-        try:
-            json_file_path = 'C:/Users/mohammed/Desktop/Airflow/Data-Engineering-Pipeline/airflow/data_set/journals.json'
+    def fetch_files(source, pattern, parse, params, run_id):
+        """Extraire en flux les fichiers de `source` modifiés depuis le dernier chargement."""
+        paths = expand_paths(pattern)
+        if not paths:
+            logging.warning(f"No file matches '{pattern}' for source '{source}'.")
+            return []
 
-            # Open and load JSON data
-            with open(json_file_path, 'r') as file:
-                data = json.load(file)
+        # Seuls les fichiers modifiés depuis la dernière exécution sont relus
+        window = extraction_window(source, 'mtime', files_high_watermark(paths), params)
+        if window is None:
+            return []
 
-            # Print or process the JSON data
-            print(json.dumps(data, indent=4))
-            return data  # Return data if needed for further tasks
+        # En mode "stream", la tâche de chargement lit elle-même les fichiers
+        if params['extract_mode'] == 'stream':
+            return [{'source': source, 'stream': True, 'window': window}]
 
-        except Exception as e:
-            print(f"Error reading JSON file: {e}")
-            return None
+        return hand_off(source, window, iter_file_chunks(modified_in(paths, window), parse, params['chunk_size']),
+                        params, run_id)
 
     @task()
-    def fetch_data_from_csv():
+    def fetch_data_from_json(params=None, run_id=None):
         try:
-            # Define the path to your CSV file
-            csv_file_path = 'C:/Users/mohammed/Desktop/Airflow/Data-Engineering-Pipeline/airflow/data_set/journals.csv'
-
-            # Initialize an empty list to store the rows
-            data_list = []
+            # Tableaux JSON, NDJSON ou documents isolés, éventuellement gzippés
+            return fetch_files('json', params['json_path_pattern'], iter_json_records, params, run_id)
 
-            # Open the CSV file and read the contents
-            with open(csv_file_path, newline='') as csvfile:
-                reader = csv.DictReader(csvfile)  # Read as a dictionary (headers as keys)
-                for row in reader:
-                    data_list.append(row)  # Append each row to the data list
-
-            # Print the data (optional)
-            print(json.dumps(data_list, indent=4))  # Pretty print the CSV data
+        except Exception as e:
+            print(f"Error reading JSON file: {e}")
+            return []
 
-            return data_list
+    @task()
+    def fetch_data_from_csv(params=None, run_id=None):
+        try:
+            # Fichiers CSV (en-tête en première ligne), éventuellement gzippés
+            return fetch_files('csv', params['csv_path_pattern'], iter_csv_records, params, run_id)
         except Exception as e:
             print(f"Error reading CSV file: {e}")
-            return None
-
+            return []
 
+    @task()
+    def advance_watermark(partitions):
+        """Enregistrer le watermark d'une source une fois toutes ses partitions chargées."""
+        if not partitions:
+            return
+        window = partitions[0]['window']
+        set_watermark(partitions[0]['source'], window['field'], window['high'])
 
     @task()
-    def insert_data_into_data_warehouse(data):
+    def insert_data_into_data_warehouse(data, params=None, run_id=None, ti=None):
+        if not data:
+            logging.warning("No data to load into the data warehouse.")
+            return
 
-        print(data)
         mysql_hook = MySqlHook(mysql_conn_id="mysql_default")
 
-        def verify_and_convert_structure(t):
-            result = []
-
-            for item in t:
-                # Si la structure correspond à la première, nous n'avons rien à faire.
-                if isinstance(item, dict) and "Title" in item and "DOI" in item and "Authors" in item:
-                    # Ajouter tel quel
-                    result.append(item)
-                else:
-                    # Sinon, nous convertissons la structure vers la première structure attendue
-                    article = {
-                        "Title": item[1],
-                        "DOI": item[2],
-                        "Authors": item[3].split(', '),  # Séparer les auteurs en liste
-                        "Publication Date": item[4].replace('Date of Publication: ', ''),
-                        "ISSN": item[5],
-                        "Link": item[6],
-                        "Quartils": item[7] if isinstance(item[7], str) else "Journal pas indexé Scopus",
-                        # Si Quartils est une chaîne, on le garde, sinon on assigne une valeur par défaut
-                        "journal_main": f"Published in: {item[1]}",
-                        "abstract": item[8] if len(item) > 8 else None  # Si l'index 8 existe, on l'assigne, sinon None
-                    }
-                    result.append(article)
-
-            return result
-        data = verify_and_convert_structure(data)
-        print(data)
-
-        def add_authors(authors):
-            try:
-                with mysql_hook.get_conn() as conn:
-                    with conn.cursor() as cursor:
-                        author_ids = []
-
-                        # Loop through authors list
-                        for author_name in authors:
-                            # Check if the author already exists
-                            cursor.execute(
-                                "SELECT AuthorID FROM Authors WHERE AuthorName = %s",
-                                (author_name,)
-                            )
-                            result = cursor.fetchone()
-
-                            if result:
-                                # Author exists, use the existing AuthorID
-                                author_id = result[0]
-                                logging.info(f"Author '{author_name}' already exists with ID {author_id}.")
-                            else:
-                                # Author does not exist, insert a new record with None for Affiliation and Country
-                                cursor.execute(
-                                    """
-                                    INSERT INTO Authors (AuthorName, Affiliation, Country)
-                                    VALUES (%s, NULL, NULL)
-                                    """,
-                                    (author_name,)
-                                )
-                                conn.commit()
-                                author_id = cursor.lastrowid
-                                logging.info(f"Author '{author_name}' added with ID {author_id}.")
-
-                            author_ids.append(author_id)
-
-                        return author_ids  # Return list of author IDs
-
-            except Exception as e:
-                logging.error(f"Error adding authors: {e}")
-                return None
-
-        # Function to get or create a journal entry
-        def determine_quartile_from_citescore(citescore):
-            """Déterminer le quartil basé sur le CiteScore."""
-            if citescore >= 4.0:
-                return "Q1"
-            elif citescore >= 2.0:
-                return "Q2"
-            elif citescore >= 1.0:
-                return "Q3"
+        def stream_chunks(descriptor):
+            """Lire la source décrite par `descriptor` morceau par morceau."""
+            if descriptor['source'] == 'mongo':
+                client = MongoHook(mongo_conn_id='mongo_default').get_conn()
+                try:
+                    yield from iter_mongo_chunks(
+                        client['bigdata']['journals'],
+                        chunk_size=params['chunk_size'],
+                        cursor_batch_size=params['mongo_cursor_batch_size'],
+                        query=mongo_window_query(descriptor['window']),
+                    )
+                finally:
+                    client.close()
+            elif descriptor['source'] == 'postgres':
+                connection = PostgresHook(postgres_conn_id='postgres_default').get_conn()
+                try:
+                    yield from iter_postgres_chunks(connection, chunk_size=params['chunk_size'],
+                                                    window=descriptor['window'])
+                finally:
+                    connection.close()
+            elif descriptor['source'] in ('json', 'csv'):
+                pattern = params[f"{descriptor['source']}_path_pattern"]
+                parse = iter_json_records if descriptor['source'] == 'json' else iter_csv_records
+                paths = modified_in(expand_paths(pattern), descriptor['window'])
+                yield from iter_file_chunks(paths, parse, params['chunk_size'])
             else:
-                return "Q4"
+                raise ValueError(f"Unknown streaming source: {descriptor['source']}")
+
+        # Durée, volumes et allers-retours de chaque étape du chargement
+        metrics = PipelineMetrics(run_id=run_id, task_id=f'{ti.task_id}[{ti.map_index}]', source=data['source'])
+
+        if data.get('stream'):
+            chunks = stream_chunks(data)
+        elif 'manifest' in data:
+            # Les fichiers de staging sont relus un morceau à la fois
+            chunks = read_chunks(data['manifest'])
+            metrics.get('read').count(bytes=sum(file.get('bytes', 0) for file in data['manifest']['files']))
+        else:
+            chunks = [data['records']]
+        chunks = metrics.timed('read', chunks)
+
+        if params['load_mode'] == 'backfill':
+            # Import massif: fichiers TSV + LOAD DATA dans des tables de staging, puis fusion
+            loader = BackfillLoader(mysql_hook, source=data['source'], run_id=run_id, metrics=metrics)
+        else:
+            # Une seule connexion pour toute la tâche: les publications et les quartils
+            # sont écrits par lots de `batch_size` et validés tous les `commit_every` lots.
+            # Une nouvelle tentative reprend après le dernier lot validé
+            loader = WarehouseLoader(mysql_hook, batch_size=params['batch_size'],
+                                     commit_every=params['commit_every'], source=data['source'],
+                                     run_id=run_id, checkpoint_key=checkpoint_key(ti), metrics=metrics)
+            chunks = loader.resume(chunks)
+
+        if params['transform_workers'] > 1:
+            # Les morceaux sont normalisés en parallèle et écrits dans l'ordre par la tâche
+            results = transform_parallel(chunks, params['transform_workers'])
+        else:
+            results = ((chunk, transform_chunk(chunk)) for chunk in chunks)
+
+        with loader:
+            while True:
+                with metrics.stage('normalize') as stage:
+                    result = next(results, None)
+                    if result is not None:
+                        chunk, transformed = result
+                        stage.count(rows_in=len(chunk),
+                                    rows_out=sum(1 for _, record, _ in transformed if record is not None))
+                if result is None:
+                    break
+                sample_payload(data['source'], chunk, params['payload_sample_rate'])
+                loader.load_transformed(transformed, chunk)
+
+        metrics.publish(mysql_hook)
+        if 'manifest' in data and not params['keep_staging_files']:
+            remove_staged(data['manifest'])
+
+    @task(trigger_rule='all_done')
+    def replay_quarantined_records(params=None, run_id=None):
+        """Rejouer en masse les enregistrements en quarantaine, source par source.
+
+        Ceux qui échouent encore sont remis en quarantaine avec leur nouvelle
+        raison; les upserts par PublicationKey rendent un rejeu répété sans effet.
+        """
+        if not params['replay_quarantine']:
+            raise AirflowSkipException("Quarantine replay is disabled (replay_quarantine).")
 
-        def process_quartil(quartil_value):
-            """Vérifier si le quartil est un nombre et le transformer en quartil valide."""
-            try:
-                # Si le quartil est un nombre, déterminer le quartil approprié
-                quartil_float = float(quartil_value)
-
-                # Retourner le quartil basé sur la valeur numérique
-                return determine_quartile_from_citescore(quartil_float)
-            except ValueError:
-                # Si ce n'est pas un nombre, il doit être déjà sous forme de quartil (par exemple "Q1", "Q2", ...)
-                return quartil_value  # Retourner le quartil tel quel s'il est valide (Q1, Q2, etc.)
-
-        def get_or_create_journal(journal_main, issn, quartils):
-            try:
-                with mysql_hook.get_conn() as conn:
-                    with conn.cursor() as cursor:
-
-                        # Extraire l'ISSN électronique
-                        electronic_issn = 'Non disponible'
-                        if isinstance(issn, dict):
-                            electronic_issn = issn.get('Electronic ISSN', 'Non disponible')
-                        elif isinstance(issn, str):
-                            electronic_issn = issn
-
-                        # Vérifier si le journal existe déjà
-                        cursor.execute("SELECT JournalID FROM Journal WHERE JournalMain = %s", (journal_main,))
-                        result = cursor.fetchone()
-
-                        if result:
-                            journal_id = result[0]
-                        else:
-                            # Insérer le journal si il n'existe pas
-                            if isinstance(quartils, list):
-                                print("quartils est une liste")
-                                cursor.execute(
-                                    "INSERT INTO Journal (JournalMain, ISSN, Quartils) VALUES (%s, %s, %s)",
-                                    (journal_main, electronic_issn, 'indexe')
-                                )
-                                conn.commit()
-                                journal_id = cursor.lastrowid
-                            elif isinstance(quartils, str):
-                                print("quartils est une chaîne de caractères")
-                                cursor.execute(
-                                    "INSERT INTO Journal (JournalMain, ISSN, Quartils) VALUES (%s, %s, %s)",
-                                    (journal_main, electronic_issn, 'pas indexe')
-                                )
-                                conn.commit()
-                                journal_id = cursor.lastrowid
-
-                        # Insérer chaque quartil associé à ce journal dans la table Quartils
-                        for quartil in quartils:
-                            annee = quartil.get('année')
-                            quartil_value = quartil.get('quartil')
-                            print("================> " + str(quartil))
-
-                            # Vérification et transformation du quartil
-                            quartil_value = process_quartil(quartil_value)
-
-                            # Log avant insertion
-                            logging.info(
-                                f"Insertion du Quartil - Annee: {annee}, Quartil: {quartil_value}, JournalID: {journal_id}")
-
-                            cursor.execute(
-                                "INSERT INTO Quartils (annee, quartil, id_journal) VALUES (%s, %s, %s) "
-                                "ON DUPLICATE KEY UPDATE quartil = VALUES(quartil)",
-                                (annee, quartil_value, journal_id)
-                            )
-
-                        conn.commit()
-
-                        return journal_id
-
-            except Exception as e:
-                logging.error(f"Error creating or retrieving journal '{journal_main}': {e}")
-                return None
-
-        def extract_journal_name(journal_main):
-            # Regular expression to capture the journal name
-            match = re.search(r"Published in:\s*([^(\n]+)", journal_main)
-            if match:
-                journal_name = match.group(1).strip()  # Capture the matched group and strip any surrounding whitespace
-                return journal_name
-            return None  # Return None if no match is found
-
-        # Function to insert a publication entry
-        def insert_publication(title, doi, publication_date, link, abstract, journal_id, last_quartil):
-            try:
-                with mysql_hook.get_conn() as conn:
+        mysql_hook = MySqlHook(mysql_conn_id="mysql_default")
+        conn = mysql_hook.get_conn()
+        try:
+            with conn.cursor() as cursor:
+                ensure_quarantine(cursor)
+                pending = pending_quarantine(cursor)
+            conn.commit()
+            if not pending:
+                logging.info("No quarantined records to replay.")
+
+            for source, last_id in pending.items():
+                replayed = []
+                with WarehouseLoader(mysql_hook, batch_size=params['batch_size'],
+                                     commit_every=params['commit_every'], source=source, run_id=run_id) as loader:
+                    while True:
+                        with conn.cursor() as cursor:
+                            page = fetch_quarantine(cursor, source, replayed[-1] if replayed else 0, last_id,
+                                                    limit=params['chunk_size'])
+                        if not page:
+                            break
+                        loader.load([entry for _, entry in page])
+                        replayed.extend(quarantine_id for quarantine_id, _ in page)
+
+                if replayed:
                     with conn.cursor() as cursor:
-                        cursor.execute(
-                            """
-                            INSERT INTO Publications (Title, DOI, PublicationDate, Link, Abstract, JournalID, Quartils)
-                            VALUES (%s, %s, %s, %s, %s, %s, %s)
-                            """,
-                            (title, doi, publication_date, link, abstract, journal_id, last_quartil)
-                        )
-                        conn.commit()
-                        logging.info(f"Publication '{title}' inserted successfully.")
-            except Exception as e:
-                logging.error(f"Error inserting publication '{title}': {e}")
-
-        # Iterate over each publication in the data
-        for entry in data:
-            try:
-                journal_main = extract_journal_name(entry.get('journal_main', '')) 
-                issn = entry.get('ISSN', {})
-                quartils = entry.get('Quartils', [])
-                Authors = entry.get('Authors', [])
-                add_authors(Authors)
-                publication_date_str = entry.get('Publication Date', '').replace("Date of Publication: ", "")
-                publication_date = datetime.strptime(publication_date_str,
-                                                     "%d %B %Y").date() if publication_date_str else None
-                doi = entry.get('DOI', '')
-                title = entry.get('Title', '')
-                link = entry.get('Link', '')
-                abstract = entry.get('abstract', '')
-
-                # Get or create the journal entry and retrieve the JournalID
-                journal_id = get_or_create_journal(journal_main, issn, quartils)
-                if not journal_id:
-                    logging.warning(f"Journal '{journal_main}' was not inserted.")
-                    continue
-
-                # Insert the publication entry with retrieved JournalID
-                last_quartil = quartils[-1].get('quartil', 'Non disponible') if quartils else 'Non disponible'
-                insert_publication(title, doi, publication_date, link, abstract, journal_id, last_quartil)
-
-            except Exception as e:
-                logging.error(f"Error processing publication '{entry.get('Title', '')}': {e}")
-
-    # Define task dependencies
-    mongo_data = fetch_data_from_mongo()
-    postgres_data = fetch_data_from_postgres()
-    json_data = fetch_data_from_json()
-    csv_data = fetch_data_from_csv()
-
-    insert_data_task_from_mongo  = insert_data_into_data_warehouse(mongo_data)
-    insert_data_task_from_postgres  = insert_data_into_data_warehouse(postgres_data)
-    # Set the order of execution
-
-    
-    mongo_data  >> insert_data_task_from_mongo  >> postgres_data >> insert_data_task_from_postgres  >> json_data >> csv_data
-     
-     
+                        for start in range(0, len(replayed), params['chunk_size']):
+                            mark_replayed(cursor, replayed[start:start + params['chunk_size']])
+                    conn.commit()
+                    logging.info(f"Replayed {len(replayed)} quarantined records from '{source}'.")
+        finally:
+            conn.close()
+
+    # Toutes les sources sont extraites en parallèle; chacune est chargée par ses
+    # propres tâches, une par partition (dynamic task mapping), puis son
+    # watermark avance une fois toutes ses partitions chargées
+    sources = {
+        'mongo': fetch_data_from_mongo(),
+        'postgres': fetch_data_from_postgres(),
+        'json': fetch_data_from_json(),
+        'csv': fetch_data_from_csv(),
+    }
+    replay = replay_quarantined_records()
+    for source, partitions in sources.items():
+        loads = insert_data_into_data_warehouse.override(task_id=f'insert_data_from_{source}').expand(data=partitions)
+        loads >> advance_watermark.override(task_id=f'advance_{source}_watermark')(partitions)
+        loads >> replay
 
 
 # Set the DAG to run
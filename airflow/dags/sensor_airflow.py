@@ -1,46 +1,57 @@
 import airflow
 from airflow import DAG
+from airflow.models.param import Param
 from airflow.operators.python import PythonOperator
 
-import random
-import time
-import json
-from datetime import datetime
-from kafka import KafkaProducer
-import logging
+from sensors.codec import FORMATS
+from sensors.producer import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_BOOTSTRAP_SERVERS,
+    DEFAULT_COMPRESSION_TYPE,
+    DEFAULT_LINGER_MS,
+    DEFAULT_TOPIC,
+    aggregate_reports,
+    run_processes,
+    sensor_ranges,
+)
+
+
+def plan_producers(params=None):
+    """Split the sensor IDs into one contiguous range per mapped producer task."""
+    return [
+        {'sensor_start': start, 'sensor_stop': stop}
+        for start, stop in sensor_ranges(params['sensor_count'], params['producer_tasks'])
+    ]
 
 
-# Function to simulate sensor data
-def generate_sensor_data(id):
-    sensor_data = {
-        "sensor_id": id,
-        "temperature": round(random.uniform(29.0, 30.0), 2),  # Random temperature between 20.0 and 30.0 degrees
-        "humidity": round(random.uniform(50.0, 51.0), 2),     # Random humidity between 30.0% and 60.0%
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+def stream_data(sensor_start, sensor_stop, params=None):
+    # Each mapped task produces its own sensor range, split again across worker processes;
+    # messages are keyed by sensor_id so each sensor stays on one partition, in order
+    config = {
+        'producer': {
+            'bootstrap_servers': params['bootstrap_servers'],
+            'linger_ms': params['linger_ms'],
+            'batch_size': params['batch_size'],
+            'compression_type': params['compression_type'],
+            'max_block_ms': 5000,
+        },
+        'topic': params['topic'],
+        'sensor_start': sensor_start,
+        'sensor_stop': sensor_stop,
+        'messages_per_second': params['messages_per_second'] * (sensor_stop - sensor_start) / params['sensor_count'],
+        'duration_seconds': params['duration_seconds'],
+        'wire_format': params['wire_format'],
     }
-    return sensor_data
+    return run_processes(config, params['processes_per_task'])
 
-def stream_data():
-    producer = KafkaProducer(bootstrap_servers=['localhost:9092'], max_block_ms=5000)
-    curr_time = time.time()
-    id = 0
-    while True:
-        if time.time() > curr_time + 60: #1 minute
-            break
-        try:
-            id += 1
-            res = generate_sensor_data(id)
-            if id >= 5:
-                id = 0
-            print(res, end="\r")
-            producer.send('sensor_data', json.dumps(res).encode('utf-8'))
-            time.sleep(1)
-        except Exception as e:
-            logging.error(f'An error occured: {e}')
-            continue
+
+def report_throughput(ti=None):
+    """Aggregate the throughput reports of all producer processes of all mapped tasks."""
+    reports = [report for task_reports in ti.xcom_pull(task_ids='sensor_data_generator') or [] if task_reports
+               for report in task_reports]
+    return aggregate_reports(reports)
 
 
-    
 dag = DAG(
     dag_id = "sensor_data",
     default_args = {
@@ -48,7 +59,24 @@ dag = DAG(
         "start_date" : airflow.utils.dates.days_ago(1),
     },
     schedule_interval = "*/5 * * * *",
-    catchup = False
+    catchup = False,
+    params = {
+        # Defaults match the original trickle: 1 message per second from 5 sensors for 1 minute
+        "messages_per_second": Param(1, type="number", exclusiveMinimum=0),
+        "sensor_count": Param(5, type="integer", minimum=1),
+        "duration_seconds": Param(60, type="number", exclusiveMinimum=0),
+        # Scale-out: mapped producer tasks (spread over Celery workers) x processes per task
+        "producer_tasks": Param(1, type="integer", minimum=1),
+        "processes_per_task": Param(1, type="integer", minimum=1),
+        "topic": Param(DEFAULT_TOPIC, type="string"),
+        # Payload encoding, announced in message headers: "json" (legacy), "struct" or "msgpack"
+        "wire_format": Param("json", enum=list(FORMATS)),
+        "bootstrap_servers": Param(DEFAULT_BOOTSTRAP_SERVERS, type="string"),
+        # KafkaProducer batching
+        "linger_ms": Param(DEFAULT_LINGER_MS, type="integer", minimum=0),
+        "batch_size": Param(DEFAULT_BATCH_SIZE, type="integer", minimum=1),
+        "compression_type": Param(DEFAULT_COMPRESSION_TYPE, enum=["gzip", "snappy", "lz4", "zstd", ""]),
+    },
 )
 
 start = PythonOperator(
@@ -57,10 +85,23 @@ start = PythonOperator(
     dag=dag
 )
 
-python_job = PythonOperator(
+plan = PythonOperator(
+    task_id="plan_sensor_ranges",
+    python_callable=plan_producers,
+    dag=dag
+)
+
+python_job = PythonOperator.partial(
     task_id="sensor_data_generator",
     python_callable=stream_data,
     dag=dag
+).expand(op_kwargs=plan.output)
+
+report = PythonOperator(
+    task_id="report_throughput",
+    python_callable=report_throughput,
+    trigger_rule="all_done",
+    dag=dag
 )
 
 end = PythonOperator(
@@ -69,4 +110,4 @@ end = PythonOperator(
     dag=dag
 )
 
-start >> python_job >> end
\ No newline at end of file
+start >> plan >> python_job >> report >> end
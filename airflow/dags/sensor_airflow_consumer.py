@@ -1,63 +1,135 @@
 import airflow
 from airflow import DAG
+from airflow.exceptions import AirflowException
+from airflow.models.param import Param
 from airflow.operators.python import PythonOperator
-import json
-from datetime import datetime
 
 from kafka import KafkaConsumer
 from elasticsearch import Elasticsearch
 
+from sensors.aggregate import DEFAULT_ALLOWED_LATENESS, DEFAULT_WINDOW_SECONDS
+from sensors.consumer import (
+    DEFAULT_BATCH_TIMEOUT,
+    DEFAULT_BOOTSTRAP_SERVERS,
+    DEFAULT_GROUP_ID,
+    DEFAULT_MAX_RECORDS,
+    DEFAULT_TOPIC,
+    consumer_lag,
+    decode_message,
+)
+from sensors.indexer import (
+    DEFAULT_INDEX,
+    DEFAULT_MAX_BYTES,
+    DEFAULT_MAX_DOCS,
+    DEFAULT_MAX_RETRIES,
+    reading_document,
+)
+from sensors.pipeline import DEFAULT_QUEUE_SIZE
+from sensors.service import DEFAULT_ES_HOSTS, run_consumer
+
+
 def index_to_elasticsearch(es, sensor_data):
     try:
-        # Convert timestamp string to ISO 8601 format
-        timestamp_str = sensor_data['timestamp']
-        timestamp = datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S")
-        iso_timestamp = timestamp.isoformat() + 'Z'  # Add 'Z' to indicate UTC
-
-        # Index the data into Elasticsearch
+        # Index the data into Elasticsearch, timestamp in ISO 8601 format (UTC)
         es.index(
-            index='sensor_data',  # Elasticsearch index name
-            body={
-                'sensor_id': sensor_data['sensor_id'],
-                'temperature': sensor_data['temperature'],
-                'humidity': sensor_data['humidity'],
-                'timestamp': iso_timestamp  # Use ISO 8601 timestamp format
-            }
+            index=DEFAULT_INDEX,  # Elasticsearch index name
+            body=reading_document(sensor_data)
         )
     except Exception as e:
         print(f"Failed to index data: {e}")
 
 
-def consume_data():
-    # Initialize the Elasticsearch client
-    es = Elasticsearch(['http://43.88.102.118:9200'])
+def consume_data(params=None):
+    params = params or {}
+
+    if params.get('index_mode', 'micro_batch') == 'single':
+        # Initialize the Elasticsearch client
+        es = Elasticsearch(DEFAULT_ES_HOSTS)
 
-    # Create a Kafka consumer
-    consumer = KafkaConsumer(
-        'sensor_data',
-        bootstrap_servers='localhost:9092',
-        auto_offset_reset='earliest',
-        group_id='sensor-group',
-        value_deserializer=lambda x: json.loads(x.decode('utf-8'))
-    )
+        # Create a Kafka consumer
+        consumer = KafkaConsumer(
+            'sensor_data',
+            bootstrap_servers='localhost:9092',
+            auto_offset_reset='earliest',
+            group_id='sensor-group',
+        )
+
+        for message in consumer:
+            sensor_data = decode_message(message)
+            if sensor_data is None:
+                continue
+
+            # Index the data into Elasticsearch, one request per reading
+            index_to_elasticsearch(es, sensor_data)
+            print(f"Indexed to Elasticsearch: {sensor_data}")
+    else:
+        # Same consumer as the sensors.service workers, run in this task
+        run_consumer({
+            'mode': params.get('index_mode', 'micro_batch'),
+            'queue_size': params.get('pipeline_queue_size', DEFAULT_QUEUE_SIZE),
+            'max_records': params.get('batch_max_records', DEFAULT_MAX_RECORDS),
+            'batch_timeout': params.get('batch_timeout', DEFAULT_BATCH_TIMEOUT),
+            'bulk_max_docs': params.get('bulk_max_docs', DEFAULT_MAX_DOCS),
+            'bulk_max_bytes': params.get('bulk_max_bytes', DEFAULT_MAX_BYTES),
+            'bulk_max_retries': params.get('bulk_max_retries', DEFAULT_MAX_RETRIES),
+            'bulk_threads': params.get('bulk_threads', 1),
+            'aggregate': params.get('aggregate', False),
+            'window_seconds': params.get('window_seconds', DEFAULT_WINDOW_SECONDS),
+            'allowed_lateness': params.get('allowed_lateness_seconds', DEFAULT_ALLOWED_LATENESS),
+            'index_raw': params.get('index_raw', True),
+        })
 
 
-    for message in consumer:
-        sensor_data = message.value
-        
-        # Index the data into Elasticsearch
-        index_to_elasticsearch(es, sensor_data)
-        print(f"Indexed to Elasticsearch: {sensor_data}")
+def check_consumer_group(params=None):
+    """Fail when the consumer service has no live member or lags too far behind the topic."""
+    status = consumer_lag(DEFAULT_TOPIC, DEFAULT_BOOTSTRAP_SERVERS, DEFAULT_GROUP_ID)
+    print(f"Consumer group '{DEFAULT_GROUP_ID}': {status}")
+    if status['members'] < params['min_members']:
+        raise AirflowException(
+            f"Consumer group '{DEFAULT_GROUP_ID}' has {status['members']} members, expected {params['min_members']}."
+        )
+    if status['total_lag'] > params['max_lag']:
+        raise AirflowException(
+            f"Consumer group '{DEFAULT_GROUP_ID}' lags {status['total_lag']} messages behind (max {params['max_lag']})."
+        )
+    return status
+
 
-    
 dag = DAG(
     dag_id = "sensor_data_consumer",
     default_args = {
         "owner" : "Prabakar Sundar",
         "start_date" : airflow.utils.dates.days_ago(1),
     },
-    schedule_interval = "@yearly",
-    catchup = False
+    # The consumer runs as the sensors.service process, supervised by sensor_consumer_health;
+    # trigger this DAG manually to consume from an Airflow worker instead
+    schedule_interval = None,
+    catchup = False,
+    params = {
+        # "micro_batch" indexes polled batches through the _bulk API and commits offsets after each one;
+        # "pipelined" runs the fetch, decode and index stages concurrently, joined by bounded queues;
+        # "single" indexes readings one request at a time, offsets auto-committed
+        "index_mode": Param("micro_batch", enum=["micro_batch", "pipelined", "single"]),
+        # pipelined only: batches buffered between two stages before fetching pauses
+        "pipeline_queue_size": Param(DEFAULT_QUEUE_SIZE, type="integer", minimum=1),
+        # A micro-batch ends at batch_max_records messages or after batch_timeout seconds
+        "batch_max_records": Param(DEFAULT_MAX_RECORDS, type="integer", minimum=1),
+        "batch_timeout": Param(DEFAULT_BATCH_TIMEOUT, type="number", exclusiveMinimum=0),
+        # A batch is split into bulk requests of at most bulk_max_docs documents and bulk_max_bytes bytes
+        "bulk_max_docs": Param(DEFAULT_MAX_DOCS, type="integer", minimum=1),
+        "bulk_max_bytes": Param(DEFAULT_MAX_BYTES, type="integer", minimum=1),
+        # micro_batch only: per-sensor tumbling-window min/max/avg/count, indexed to sensor_data_rollup
+        "aggregate": Param(False, type="boolean"),
+        "window_seconds": Param(DEFAULT_WINDOW_SECONDS, type="integer", minimum=1),
+        # Readings older than the newest one by more than this are late once their window closed
+        "allowed_lateness_seconds": Param(DEFAULT_ALLOWED_LATENESS, type="number", minimum=0),
+        # Index the raw readings alongside the rollups
+        "index_raw": Param(True, type="boolean"),
+        # Retries of the items rejected with a retryable status (429, 502-504)
+        "bulk_max_retries": Param(DEFAULT_MAX_RETRIES, type="integer", minimum=0),
+        # More than one thread sends bulk requests concurrently (helpers.parallel_bulk)
+        "bulk_threads": Param(1, type="integer", minimum=1),
+    },
 )
 
 start = PythonOperator(
@@ -78,4 +150,27 @@ end = PythonOperator(
     dag=dag
 )
 
-start >> python_job >> end
\ No newline at end of file
+start >> python_job >> end
+
+
+health_dag = DAG(
+    dag_id = "sensor_consumer_health",
+    default_args = {
+        "owner" : "Prabakar Sundar",
+        "start_date" : airflow.utils.dates.days_ago(1),
+    },
+    schedule_interval = "*/5 * * * *",
+    catchup = False,
+    params = {
+        # Live consumer processes expected in the group (sensors.service --processes, times its replicas)
+        "min_members": Param(1, type="integer", minimum=0),
+        # Messages not yet committed by the group, summed over the partitions
+        "max_lag": Param(100000, type="integer", minimum=0),
+    },
+)
+
+health_check = PythonOperator(
+    task_id="check_consumer_group",
+    python_callable=check_consumer_group,
+    dag=health_dag
+)
@@ -0,0 +1 @@
+"""Helpers for producing and consuming the sensor_data Kafka stream."""
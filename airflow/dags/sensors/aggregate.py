@@ -0,0 +1,194 @@
+import logging
+import time
+
+from sensors.indexer import iso_timestamp
+
+
+DEFAULT_ROLLUP_INDEX = 'sensor_data_rollup'
+DEFAULT_WINDOW_SECONDS = 60
+
+# How far behind the newest reading a reading may arrive and still count in its window
+DEFAULT_ALLOWED_LATENESS = 10
+
+# Seconds (wall clock) without readings after which a partition no longer holds the watermark back
+DEFAULT_IDLE_TIMEOUT = 60
+
+FIELDS = ('temperature', 'humidity')
+
+# A window can be emitted again from a partial replay (after a restart or a rewind):
+# keep whichever version aggregated the most readings
+KEEP_LARGEST_SCRIPT = (
+    "if (ctx._source.count == null || params.doc.count >= ctx._source.count) "
+    "{ ctx._source.putAll(params.doc) } else { ctx.op = 'none' }"
+)
+
+
+class Window:
+    """Running count, min, max and sum of the readings of one sensor in one window."""
+
+    __slots__ = ('sensor_id', 'start_ms', 'end_ms', 'count', 'minimum', 'maximum', 'total', 'offsets')
+
+    def __init__(self, sensor_id, start_ms, end_ms):
+        self.sensor_id = sensor_id
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.count = 0
+        self.minimum = {}
+        self.maximum = {}
+        self.total = dict.fromkeys(FIELDS, 0.0)
+        # First offset of the window's readings per partition, held back from commits
+        self.offsets = {}
+
+    def add(self, reading, partition=None, offset=None):
+        self.count += 1
+        for field in FIELDS:
+            value = reading[field]
+            self.minimum[field] = min(self.minimum.get(field, value), value)
+            self.maximum[field] = max(self.maximum.get(field, value), value)
+            self.total[field] += value
+        if partition is not None and partition not in self.offsets:
+            self.offsets[partition] = offset
+
+    def document(self):
+        document = {
+            'sensor_id': self.sensor_id,
+            'window_start': iso_timestamp(self.start_ms),
+            'window_end': iso_timestamp(self.end_ms),
+            'count': self.count,
+        }
+        for field in FIELDS:
+            document[f'{field}_min'] = self.minimum[field]
+            document[f'{field}_max'] = self.maximum[field]
+            document[f'{field}_avg'] = round(self.total[field] / self.count, 4)
+        return document
+
+
+class WindowAggregator:
+    """Tumbling event-time windows of readings per sensor_id.
+
+    Each partition tracks its newest reading timestamp; the watermark trails
+    the oldest of them by `allowed_lateness` seconds, so a partition that
+    lags behind the others (after a restart or a rebalance) holds it back
+    instead of having its readings counted as late. A partition without
+    readings for `idle_timeout` seconds stops holding it back. The watermark
+    is updated on ``close_ready``, and as soon as a partition sends its first
+    reading. A window is closed once the watermark passes its end, and a
+    reading whose window is already closed is counted as late and left out
+    of the rollups. Windows of a sensor that stopped sending close when
+    newer readings of other sensors move the watermark, or on ``close_all``.
+    """
+
+    def __init__(self, window_seconds=DEFAULT_WINDOW_SECONDS, allowed_lateness=DEFAULT_ALLOWED_LATENESS,
+                 index=DEFAULT_ROLLUP_INDEX, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        self.window_ms = int(window_seconds * 1000)
+        self.lateness_ms = int(allowed_lateness * 1000)
+        self.index = index
+        self.idle_timeout = idle_timeout
+        self.windows = {}
+        # Newest reading timestamp and wall-clock time of the last reading, per partition
+        self.max_timestamps = {}
+        self.last_seen = {}
+        self.watermark_ms = None
+        self.readings = 0
+        self.late = 0
+        self.closed = 0
+
+    def add(self, reading, partition=None, offset=None):
+        """Add a reading to its window; False if the window was already closed."""
+        timestamp_ms = reading['timestamp_ms']
+        start_ms = timestamp_ms - timestamp_ms % self.window_ms
+        self.last_seen[partition] = time.monotonic()
+        if partition not in self.max_timestamps:
+            # A partition just assigned may lag behind the others: it holds the watermark back from now on
+            self.max_timestamps[partition] = timestamp_ms
+            self.update_watermark()
+        elif timestamp_ms > self.max_timestamps[partition]:
+            self.max_timestamps[partition] = timestamp_ms
+        if self.watermark_ms is not None and start_ms + self.window_ms <= self.watermark_ms:
+            self.late += 1
+            return False
+
+        key = (reading['sensor_id'], start_ms)
+        window = self.windows.get(key)
+        if window is None:
+            window = self.windows[key] = Window(reading['sensor_id'], start_ms, start_ms + self.window_ms)
+        window.add(reading, partition, offset)
+        self.readings += 1
+        return True
+
+    def update_watermark(self):
+        """Set the watermark from the oldest newest timestamp of the active partitions."""
+        now = time.monotonic()
+        active = [timestamp_ms for partition, timestamp_ms in self.max_timestamps.items()
+                  if now - self.last_seen[partition] < self.idle_timeout]
+        if not active:
+            active = self.max_timestamps.values()
+        self.watermark_ms = min(active) - self.lateness_ms if active else None
+        return self.watermark_ms
+
+    def close_ready(self):
+        """Update the watermark and close the windows it has passed; returns their bulk actions."""
+        watermark_ms = self.update_watermark()
+        if watermark_ms is None:
+            return []
+        ready = [key for key, window in self.windows.items() if window.end_ms <= watermark_ms]
+        return self._close(ready)
+
+    def close_all(self):
+        return self._close(list(self.windows))
+
+    def _close(self, keys):
+        actions = [self.action(self.windows.pop(key)) for key in sorted(keys, key=lambda key: key[1])]
+        self.closed += len(actions)
+        return actions
+
+    def action(self, window):
+        """Bulk upsert of a window, with an ID stable across replays."""
+        document = window.document()
+        return {
+            '_op_type': 'update',
+            '_index': self.index,
+            '_id': f'{window.sensor_id}-{window.start_ms}',
+            'scripted_upsert': True,
+            'script': {'source': KEEP_LARGEST_SCRIPT, 'lang': 'painless', 'params': {'doc': document}},
+            'upsert': {},
+        }
+
+    def held_offsets(self):
+        """Lowest offset per partition still needed by an open window."""
+        held = {}
+        for window in self.windows.values():
+            for partition, offset in window.offsets.items():
+                if partition not in held or offset < held[partition]:
+                    held[partition] = offset
+        return held
+
+    def drop_partitions(self, partitions):
+        """Drop the open windows and the timestamps of `partitions` (revoked from this consumer)."""
+        partitions = set(partitions)
+        for key in [key for key, window in self.windows.items() if partitions & window.offsets.keys()]:
+            del self.windows[key]
+        for partition in partitions:
+            self.max_timestamps.pop(partition, None)
+            self.last_seen.pop(partition, None)
+
+    def reset(self):
+        """Drop the open windows and the watermark, before consuming again from committed offsets."""
+        self.windows.clear()
+        self.max_timestamps.clear()
+        self.last_seen.clear()
+        self.watermark_ms = None
+
+    def report(self):
+        summary = {
+            'readings': self.readings,
+            'late': self.late,
+            'closed': self.closed,
+            'open': len(self.windows),
+            'reduction': round(self.readings / self.closed, 1) if self.closed else None,
+        }
+        logging.info(
+            f"Aggregated {summary['readings']} readings into {summary['closed']} closed windows "
+            f"({summary['reduction']} readings per document), {summary['open']} open, {summary['late']} late."
+        )
+        return summary
@@ -0,0 +1,476 @@
+"""End-to-end streaming benchmark with in-process Kafka and Elasticsearch stand-ins.
+
+Produces readings with ``run_generator`` (as the sensor_data DAG does) into
+an in-memory topic while a consumer mode (as ``consume_data`` or
+sensors.service run it) reads the topic and indexes into an in-memory
+index. The index simulates the Elasticsearch cost of a request and of each
+document, and can reject a fraction of the documents with 429 to exercise
+the retries. Each mode runs in a fresh process.
+
+Reports messages/sec indexed, p50/p99 end-to-end latency (from the send to
+the commit of the offset, i.e. once the reading is indexed and acknowledged)
+and consumer CPU per message (process CPU minus the producer thread). With
+``--aggregate``, offsets are held back by the open windows, so the latency
+only covers the windows closed during the run: the windows default to one
+second here (``--window-seconds``, ``--allowed-lateness``) so a short run
+closes most of them.
+
+From airflow/dags::
+
+    python -m sensors.benchmark --messages-per-second 20000 --duration 5
+    python -m sensors.benchmark --mode micro_batch pipelined --es-request-ms 20 --json results.json
+    python -m sensors.benchmark --baseline results.json --tolerance 0.2
+
+With ``--baseline``, the exit code is 1 if a mode indexes slower, or has a
+higher p99 latency, than the baseline beyond the tolerance.
+"""
+import argparse
+import itertools
+import json
+import logging
+import multiprocessing
+import random
+import sys
+import threading
+import time
+import zlib
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from sensors.aggregate import WindowAggregator
+from sensors.consumer import BatchStats, decode_message, run_micro_batches
+from sensors.indexer import DEFAULT_INDEX, BulkIndexer, reading_document
+from sensors.pipeline import DEFAULT_QUEUE_SIZE, PipelinedConsumer
+from sensors.producer import DeliveryStats, run_generator
+
+
+MODES = ('single', 'micro_batch', 'pipelined')
+
+Message = namedtuple('Message', 'topic partition offset key value headers')
+RecordMetadata = namedtuple('RecordMetadata', 'topic partition offset')
+
+
+class MemoryTopic:
+    """Partitioned, append-only log shared by the producer and consumer stand-ins."""
+
+    def __init__(self, name, partitions):
+        self.name = name
+        self.partitions = [[] for _ in range(partitions)]
+        # Send time of each message, per partition, for the end-to-end latency
+        self.sent_at = [[] for _ in range(partitions)]
+        self.condition = threading.Condition()
+
+    def append(self, key, value, headers):
+        # Stable key hashing: a sensor always lands on the same partition, as with Kafka's partitioner
+        partition = zlib.crc32(key) % len(self.partitions) if key is not None else 0
+        with self.condition:
+            log = self.partitions[partition]
+            offset = len(log)
+            log.append(Message(self.name, partition, offset, key, value, headers))
+            self.sent_at[partition].append(time.monotonic())
+            self.condition.notify_all()
+        return RecordMetadata(self.name, partition, offset)
+
+    def end_offsets(self):
+        return [len(log) for log in self.partitions]
+
+
+class DoneFuture:
+    """Already-acknowledged send, as returned by KafkaProducer.send."""
+
+    def __init__(self, metadata):
+        self.metadata = metadata
+
+    def add_callback(self, callback):
+        callback(self.metadata)
+        return self
+
+    def add_errback(self, errback):
+        return self
+
+
+class MemoryProducer:
+    """KafkaProducer stand-in appending to a MemoryTopic."""
+
+    def __init__(self, topic):
+        self.topic = topic
+
+    def send(self, topic, key=None, value=None, headers=None):
+        return DoneFuture(self.topic.append(key, value, headers))
+
+    def flush(self, timeout=None):
+        pass
+
+    def close(self):
+        pass
+
+
+class MemoryConsumer:
+    """KafkaConsumer stand-in, sole member of its group: all partitions are assigned to it.
+
+    Implements what sensors.consumer and sensors.pipeline use; iterating
+    over it (the single mode) commits automatically, like the default
+    KafkaConsumer, and stops once `stop()` returns True.
+    """
+
+    def __init__(self, topic, stop=None):
+        from kafka import TopicPartition
+
+        self.topic = topic
+        self.stop = stop or (lambda: False)
+        self.partitions = [TopicPartition(topic.name, index) for index in range(len(topic.partitions))]
+        self.positions = dict.fromkeys(self.partitions, 0)
+        self.offsets = {}
+        self.paused_partitions = set()
+        self.commits = 0
+        # (commit time, partition, first offset, next offset) of each committed range
+        self.committed_ranges = []
+
+    def subscribe(self, topics=None, listener=None):
+        if listener is not None:
+            listener.on_partitions_assigned(set(self.partitions))
+
+    def assignment(self):
+        return set(self.partitions)
+
+    def poll(self, timeout_ms=0, max_records=500):
+        deadline = time.monotonic() + timeout_ms / 1000
+        with self.topic.condition:
+            while True:
+                records = self._fetch(max_records)
+                remaining = deadline - time.monotonic()
+                if records or remaining <= 0:
+                    return records
+                self.topic.condition.wait(remaining)
+
+    def _fetch(self, max_records):
+        records = {}
+        for partition in self.partitions:
+            if max_records <= 0:
+                break
+            if partition in self.paused_partitions:
+                continue
+            position = self.positions[partition]
+            messages = self.topic.partitions[partition.partition][position:position + max_records]
+            if messages:
+                records[partition] = messages
+                self.positions[partition] = position + len(messages)
+                max_records -= len(messages)
+        return records
+
+    def __iter__(self):
+        while not self.stop():
+            for messages in self.poll(timeout_ms=100, max_records=500).values():
+                for message in messages:
+                    yield message
+                    # Auto-commit of the consumed position
+                    self._commit_offset(self.partitions[message.partition], message.offset + 1)
+
+    def position(self, partition):
+        return self.positions[partition]
+
+    def committed(self, partition):
+        return self.offsets.get(partition)
+
+    def commit(self, offsets=None):
+        self.commits += 1
+        if offsets is None:
+            offsets = self.positions
+        else:
+            offsets = {partition: metadata.offset for partition, metadata in offsets.items()}
+        for partition, offset in offsets.items():
+            self._commit_offset(partition, offset)
+
+    def _commit_offset(self, partition, offset):
+        previous = self.offsets.get(partition, 0)
+        if offset > previous:
+            self.committed_ranges.append((time.monotonic(), partition.partition, previous, offset))
+        self.offsets[partition] = offset
+
+    def latencies(self):
+        """Seconds from the send to the commit of each committed message, sorted."""
+        return sorted(
+            committed - sent
+            for committed, partition, first, end in self.committed_ranges
+            for sent in self.topic.sent_at[partition][first:end]
+        )
+
+    def seek(self, partition, offset):
+        self.positions[partition] = offset
+
+    def seek_to_beginning(self, partition):
+        self.positions[partition] = 0
+
+    def pause(self, *partitions):
+        self.paused_partitions.update(partitions)
+
+    def resume(self, *partitions):
+        self.paused_partitions.difference_update(partitions)
+
+    def paused(self):
+        return set(self.paused_partitions)
+
+    def close(self, autocommit=True):
+        pass
+
+
+class MemoryIndex:
+    """Elasticsearch stand-in: stores documents after simulating the request cost.
+
+    The cost is slept, like a network wait, so the consumer threads can
+    overlap it. A fraction of the documents is rejected with 429.
+    """
+
+    def __init__(self, request_ms=1.0, document_us=10.0, reject_fraction=0.0, seed=0):
+        self.request_seconds = request_ms / 1000
+        self.document_seconds = document_us / 1e6
+        self.reject_fraction = reject_fraction
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.documents = 0
+        self.last_indexed = None
+        self.rollups = 0
+        self.rejected = 0
+
+    def index(self, index=None, body=None):
+        """Single-document API, as used by index_to_elasticsearch."""
+        time.sleep(self.request_seconds + self.document_seconds)
+        with self.lock:
+            self.requests += 1
+            self.documents += 1
+            self.last_indexed = time.monotonic()
+
+    def bulk(self, actions):
+        """Bulk API; returns the rejected actions as (action, status, error)."""
+        time.sleep(self.request_seconds + self.document_seconds * len(actions))
+        failures = []
+        with self.lock:
+            self.requests += 1
+            self.last_indexed = time.monotonic()
+            for action in actions:
+                if self.reject_fraction and self.random.random() < self.reject_fraction:
+                    self.rejected += 1
+                    failures.append((action, 429, 'es_rejected_execution_exception'))
+                elif '_source' in action:
+                    self.documents += 1
+                else:
+                    self.rollups += 1
+        return failures
+
+
+class MemoryIndexer(BulkIndexer):
+    """BulkIndexer sending its bulk requests to a MemoryIndex."""
+
+    def _send(self, actions):
+        return self.es.bulk(actions)
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else None
+
+
+def run_scenario(config):
+    """Produce and consume in this process; returns the measurements."""
+    logging.basicConfig(level=logging.WARNING)
+    # Stage reports and retries are part of the measurement, not of the output
+    logging.getLogger().setLevel(logging.ERROR)
+
+    topic = MemoryTopic('sensor_data', config['partitions'])
+    index = MemoryIndex(config['es_request_ms'], config['es_document_us'], config['reject_fraction'],
+                        config['seed'])
+    delivery = DeliveryStats()
+    producer_done = threading.Event()
+    producer_cpu = []
+
+    def produce():
+        started = time.thread_time()
+        try:
+            run_generator(
+                MemoryProducer(topic),
+                topic=topic.name,
+                messages_per_second=config['messages_per_second'],
+                sensor_ids=range(1, config['sensors'] + 1),
+                duration_seconds=config['duration'],
+                wire_format=config['wire_format'],
+                stats=delivery,
+            )
+        finally:
+            producer_cpu.append(time.thread_time() - started)
+            producer_done.set()
+
+    deadline = time.monotonic() + config['duration'] + config['drain_timeout']
+
+    def should_stop():
+        if time.monotonic() >= deadline:
+            return True
+        if not producer_done.is_set() or index.documents < delivery.sent:
+            return False
+        # Everything is indexed; with the window rollups, offsets stay held back by the open windows
+        # (their latency then includes the time a window stays open)
+        return config['aggregate'] or all(
+            consumer.committed(partition) == end
+            for partition, end in zip(consumer.partitions, topic.end_offsets())
+        )
+
+    consumer = MemoryConsumer(topic, stop=should_stop)
+    indexer = MemoryIndexer(index, max_docs=config['bulk_max_docs'], max_retries=3, initial_backoff=0.01)
+    aggregator = None
+    if config['aggregate']:
+        aggregator = WindowAggregator(window_seconds=config['window_seconds'],
+                                      allowed_lateness=config['allowed_lateness'])
+
+    producer = threading.Thread(target=produce, name='producer')
+    cpu_started = time.process_time()
+    started = time.monotonic()
+    producer.start()
+
+    stages = None
+    if config['mode'] == 'single':
+        # consume_data with index_mode=single: one request per reading
+        for message in consumer:
+            sensor_data = decode_message(message)
+            if sensor_data is not None:
+                index.index(index=DEFAULT_INDEX, body=reading_document(sensor_data))
+    elif config['mode'] == 'micro_batch':
+        run_micro_batches(consumer, indexer, max_records=config['max_records'], batch_timeout=config['batch_timeout'],
+                          aggregator=aggregator, should_stop=should_stop, stats=BatchStats())
+    else:
+        pipeline = PipelinedConsumer(indexer, max_records=config['max_records'],
+                                     batch_timeout=config['batch_timeout'], queue_size=config['queue_size'])
+        stages = pipeline.run(consumer, should_stop=should_stop).report()
+
+    producer.join()
+    cpu_seconds = time.process_time() - cpu_started - producer_cpu[0]
+
+    latencies = [latency * 1000 for latency in consumer.latencies()]
+    seconds = (index.last_indexed or time.monotonic()) - started
+    documents = index.documents
+    return {
+        'config': config,
+        'produced': delivery.sent,
+        'indexed': documents,
+        'rollups': index.rollups,
+        'rejected': index.rejected,
+        'requests': index.requests,
+        'commits': consumer.commits,
+        'timed_out': documents < delivery.sent,
+        'seconds': round(seconds, 3),
+        'messages_per_second': round(documents / seconds, 1) if seconds > 0 else None,
+        'latency_p50_ms': round(percentile(latencies, 0.5), 1) if latencies else None,
+        'latency_p99_ms': round(percentile(latencies, 0.99), 1) if latencies else None,
+        'latency_max_ms': round(latencies[-1], 1) if latencies else None,
+        'cpu_us_per_message': round(cpu_seconds / documents * 1e6, 1) if documents else None,
+        'indexer': indexer.report() if config['mode'] != 'single' else None,
+        'stages': stages,
+    }
+
+
+def scenario_name(config):
+    name = f"{config['mode']} {config['wire_format']} {config['messages_per_second']:g} msg/s"
+    if config['aggregate']:
+        name += f" +rollups {config['window_seconds']:g}s"
+    return name
+
+
+def print_result(result):
+    print(f"\n{scenario_name(result['config'])}: {result['messages_per_second']} msg/s indexed, "
+          f"latency p50 {result['latency_p50_ms']} ms / p99 {result['latency_p99_ms']} ms / "
+          f"max {result['latency_max_ms']} ms, {result['cpu_us_per_message']} us CPU per message")
+    print(f"  {result['indexed']}/{result['produced']} indexed in {result['seconds']}s"
+          f"{' (timed out)' if result['timed_out'] else ''}, {result['requests']} requests, "
+          f"{result['commits']} commits, {result['rejected']} rejections retried, {result['rollups']} rollups")
+    if result['indexer']:
+        indexer = result['indexer']
+        print(f"  bulk: {indexer['flushes']} flushes, latency avg {indexer['flush_latency_avg_ms']} ms, "
+              f"p99 {indexer['flush_latency_p99_ms']} ms")
+    if result['stages']:
+        print(f"  {'stage':<14}{'count':>8}{'avg ms':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for name, latency in result['stages']['latency'].items():
+            if latency:
+                print(f"  {name:<14}{latency['count']:>8}{latency['avg_ms']:>10}{latency['p50_ms']:>10}"
+                      f"{latency['p99_ms']:>10}{latency['max_ms']:>10}")
+        depths = result['stages']['queue_depth']
+        print("  queue depth: " + ', '.join(f"{name} avg {depth['avg']} max {depth['max']}"
+                                            for name, depth in depths.items())
+              + f"; paused {result['stages']['paused_seconds']}s")
+
+
+def compare(results, baseline, tolerance):
+    """List the regressions against the baseline results."""
+    previous = {scenario_name(result['config']): result for result in baseline}
+    regressions = []
+    for result in results:
+        name = scenario_name(result['config'])
+        reference = previous.get(name)
+        if reference is None:
+            continue
+        if (result['messages_per_second'] or 0) < (reference['messages_per_second'] or 0) * (1 - tolerance):
+            regressions.append(f"{name}: {result['messages_per_second']} msg/s, "
+                               f"baseline {reference['messages_per_second']} msg/s")
+        if reference['latency_p99_ms'] is not None and result['latency_p99_ms'] is not None \
+                and result['latency_p99_ms'] > reference['latency_p99_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p99 {result['latency_p99_ms']} ms, "
+                               f"baseline {reference['latency_p99_ms']} ms")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end streaming benchmark (in-process Kafka and ES).")
+    parser.add_argument('--mode', nargs='+', choices=MODES, default=list(MODES))
+    parser.add_argument('--wire-format', nargs='+', choices=['json', 'struct', 'msgpack'], default=['json'])
+    parser.add_argument('--messages-per-second', type=float, nargs='+', default=[5000])
+    parser.add_argument('--duration', type=float, default=5, help="Seconds of production")
+    parser.add_argument('--drain-timeout', type=float, default=20,
+                        help="Seconds allowed after production to index the backlog")
+    parser.add_argument('--sensors', type=int, default=100)
+    parser.add_argument('--partitions', type=int, default=6)
+    parser.add_argument('--max-records', type=int, default=1000)
+    parser.add_argument('--batch-timeout', type=float, default=0.2)
+    parser.add_argument('--bulk-max-docs', type=int, default=1000)
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE)
+    parser.add_argument('--aggregate', action='store_true', help="Also roll readings up (micro_batch)")
+    parser.add_argument('--window-seconds', type=float, default=1.0,
+                        help="Rollup window; the service default (60s) closes none in a short run")
+    parser.add_argument('--allowed-lateness', type=float, default=1.0)
+    parser.add_argument('--es-request-ms', type=float, default=1.0, help="Simulated cost of an ES request")
+    parser.add_argument('--es-document-us', type=float, default=10.0, help="Simulated cost per document")
+    parser.add_argument('--reject-fraction', type=float, default=0.0, help="Documents rejected with 429")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="Write the results to this file")
+    parser.add_argument('--baseline', help="Compare with the results of a previous --json run")
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    base = {
+        'duration': args.duration, 'drain_timeout': args.drain_timeout, 'sensors': args.sensors,
+        'partitions': args.partitions, 'max_records': args.max_records, 'batch_timeout': args.batch_timeout,
+        'bulk_max_docs': args.bulk_max_docs, 'queue_size': args.queue_size, 'es_request_ms': args.es_request_ms,
+        'es_document_us': args.es_document_us, 'reject_fraction': args.reject_fraction, 'seed': args.seed,
+        'window_seconds': args.window_seconds, 'allowed_lateness': args.allowed_lateness,
+    }
+    results = []
+    for mode, wire_format, rate in itertools.product(args.mode, args.wire_format, args.messages_per_second):
+        config = dict(base, mode=mode, wire_format=wire_format, messages_per_second=rate,
+                      aggregate=args.aggregate and mode == 'micro_batch')
+        # Fresh process per scenario: no threads, memory or CPU time left over from the previous one
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            result = executor.submit(run_scenario, config).result()
+        print_result(result)
+        results.append(result)
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+import calendar
+import json
+import struct
+from datetime import datetime
+
+
+# Kafka headers used to negotiate the payload format; messages without them
+# are legacy JSON readings with a "%Y-%m-%d %H:%M:%S" timestamp
+CONTENT_TYPE_HEADER = 'content-type'
+SCHEMA_ID_HEADER = 'schema-id'
+
+LEGACY_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Schema 1, fixed little-endian layout: sensor_id uint32, timestamp epoch ms int64,
+# temperature float64, humidity float64 (28 bytes)
+SENSOR_STRUCT = struct.Struct('<Iqdd')
+SCHEMA_ID = 1
+
+CONTENT_TYPES = {
+    'json': b'application/json',
+    'struct': b'application/x-sensor-struct',
+    'msgpack': b'application/x-msgpack',
+}
+FORMATS = tuple(CONTENT_TYPES)
+
+
+def encode_json(reading):
+    """Legacy JSON payload, timestamp formatted in local time."""
+    return json.dumps({
+        'sensor_id': reading['sensor_id'],
+        'temperature': reading['temperature'],
+        'humidity': reading['humidity'],
+        'timestamp': datetime.fromtimestamp(reading['timestamp_ms'] / 1000).strftime(LEGACY_TIMESTAMP_FORMAT),
+    }).encode('utf-8')
+
+
+def encode_struct(reading):
+    return SENSOR_STRUCT.pack(reading['sensor_id'], reading['timestamp_ms'], reading['temperature'],
+                              reading['humidity'])
+
+
+def encode_msgpack(reading):
+    import msgpack
+
+    # Positional array, same field order as SENSOR_STRUCT
+    return msgpack.packb([reading['sensor_id'], reading['timestamp_ms'], reading['temperature'],
+                          reading['humidity']])
+
+
+ENCODERS = {
+    'json': encode_json,
+    'struct': encode_struct,
+    'msgpack': encode_msgpack,
+}
+
+
+def message_headers(wire_format):
+    """Kafka headers announcing the payload format of `wire_format` messages."""
+    if wire_format == 'json':
+        return None  # Readable by consumers that predate format negotiation
+    return [(CONTENT_TYPE_HEADER, CONTENT_TYPES[wire_format]), (SCHEMA_ID_HEADER, str(SCHEMA_ID).encode())]
+
+
+def header_value(headers, name):
+    for key, value in headers or ():
+        if key == name:
+            return value
+    return None
+
+
+def decode_json(value):
+    data = json.loads(value)
+    if 'timestamp_ms' not in data:
+        # Legacy readings: naive timestamp, indexed as UTC since the first consumer
+        timestamp = datetime.strptime(data.pop('timestamp'), LEGACY_TIMESTAMP_FORMAT)
+        data['timestamp_ms'] = calendar.timegm(timestamp.timetuple()) * 1000
+    return data
+
+
+def decode_fields(sensor_id, timestamp_ms, temperature, humidity):
+    return {'sensor_id': sensor_id, 'temperature': temperature, 'humidity': humidity, 'timestamp_ms': timestamp_ms}
+
+
+def decode(value, headers=None):
+    """Decode a sensor_data message according to its headers.
+
+    Returns a reading with `sensor_id`, `temperature`, `humidity` and
+    `timestamp_ms` (epoch milliseconds, UTC).
+    """
+    content_type = header_value(headers, CONTENT_TYPE_HEADER)
+    if content_type is None or content_type == CONTENT_TYPES['json']:
+        return decode_json(value)
+
+    schema_id = header_value(headers, SCHEMA_ID_HEADER)
+    if schema_id is not None and int(schema_id) != SCHEMA_ID:
+        raise ValueError(f"Unsupported sensor schema id {schema_id!r}")
+    if content_type == CONTENT_TYPES['struct']:
+        return decode_fields(*SENSOR_STRUCT.unpack(value))
+    if content_type == CONTENT_TYPES['msgpack']:
+        import msgpack
+
+        return decode_fields(*msgpack.unpackb(value))
+    raise ValueError(f"Unsupported sensor payload content type {content_type!r}")
@@ -0,0 +1,274 @@
+import logging
+import time
+
+from sensors.codec import decode
+from sensors.indexer import IndexingError, reading_document, reading_id
+
+
+DEFAULT_TOPIC = 'sensor_data'
+DEFAULT_BOOTSTRAP_SERVERS = 'localhost:9092'
+DEFAULT_GROUP_ID = 'sensor-group'
+
+# A micro-batch ends when it holds max_records messages or after batch_timeout seconds
+DEFAULT_MAX_RECORDS = 1000
+DEFAULT_BATCH_TIMEOUT = 1.0
+
+# Pause before consuming again from the committed offsets after a failed flush
+DEFAULT_ERROR_BACKOFF = 5.0
+
+# Seconds between two throughput reports
+REPORT_INTERVAL = 60
+
+
+def make_consumer(topic=DEFAULT_TOPIC, bootstrap_servers=DEFAULT_BOOTSTRAP_SERVERS, group_id=DEFAULT_GROUP_ID,
+                  listener=None, **config):
+    """KafkaConsumer whose offsets are committed by the application, after indexing."""
+    from kafka import KafkaConsumer
+
+    consumer = KafkaConsumer(
+        bootstrap_servers=bootstrap_servers,
+        auto_offset_reset='earliest',
+        group_id=group_id,
+        enable_auto_commit=False,
+        **config
+    )
+    consumer.subscribe(topics=[topic], listener=listener)
+    return consumer
+
+
+def rebalance_listener(aggregator=None, on_revoked=None):
+    """Listener logging partition moves and dropping the windows of revoked partitions.
+
+    Micro-batches are committed before the next poll, so only the open
+    windows (whose offsets are held back) are pending on revocation: the
+    new owner of the partition rebuilds them from the committed offsets.
+    `on_revoked` is called first, e.g. to index and commit batches still
+    in flight.
+    """
+    from kafka import ConsumerRebalanceListener
+
+    class Listener(ConsumerRebalanceListener):
+        def on_partitions_revoked(self, revoked):
+            if on_revoked is not None:
+                on_revoked()
+            if revoked:
+                logging.info(f"Partitions revoked: {sorted(partition.partition for partition in revoked)}")
+            if aggregator is not None:
+                aggregator.drop_partitions((partition.topic, partition.partition) for partition in revoked)
+
+        def on_partitions_assigned(self, assigned):
+            logging.info(f"Partitions assigned: {sorted(partition.partition for partition in assigned)}")
+
+    return Listener()
+
+
+def decode_message(message):
+    """Decoded reading of a message, or None if its payload cannot be decoded."""
+    # The payload format (legacy JSON, struct, msgpack) is given by the message headers
+    try:
+        return decode(message.value, message.headers)
+    except Exception as e:
+        logging.warning(f"Failed to decode message at {message.topic}[{message.partition}]@{message.offset}: {e}")
+        return None
+
+
+def poll_batch(consumer, max_records=DEFAULT_MAX_RECORDS, timeout=DEFAULT_BATCH_TIMEOUT):
+    """Poll until `max_records` messages are fetched or `timeout` seconds have passed."""
+    batch = []
+    deadline = time.monotonic() + timeout
+    while len(batch) < max_records:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        records = consumer.poll(timeout_ms=int(remaining * 1000), max_records=max_records - len(batch))
+        for messages in records.values():
+            batch.extend(messages)
+    return batch
+
+
+def assigned_only(consumer, batch):
+    """Messages of the batch whose partition is still assigned, after a rebalance during the poll."""
+    assigned = {(partition.topic, partition.partition) for partition in consumer.assignment()}
+    return [message for message in batch if (message.topic, message.partition) in assigned]
+
+
+def rewind(consumer):
+    """Seek the assigned partitions back to their committed offsets."""
+    for partition in consumer.assignment():
+        offset = consumer.committed(partition)
+        if offset is None:
+            consumer.seek_to_beginning(partition)
+        else:
+            consumer.seek(partition, offset)
+
+
+def offset_and_metadata(offset):
+    from kafka.structs import OffsetAndMetadata
+
+    try:
+        # kafka-python >= 2.1 adds the leader epoch
+        return OffsetAndMetadata(offset, '', -1)
+    except TypeError:
+        return OffsetAndMetadata(offset, '')
+
+
+def held_positions(consumer, held):
+    """Offsets to commit when `held` maps (topic, partition) to the lowest offset an open window still needs."""
+    if not held:
+        return None
+    offsets = {}
+    for partition in consumer.assignment():
+        key = (partition.topic, partition.partition)
+        position = consumer.position(partition)
+        offsets[key] = min(held.get(key, position), position)
+    return offsets
+
+
+def commit(consumer, offsets=None):
+    """Commit `offsets` ((topic, partition) -> next offset to read), by default the consumed positions.
+
+    Returns False if the group rebalanced in the meantime.
+    """
+    from kafka import TopicPartition
+    from kafka.errors import CommitFailedError
+
+    if offsets is not None:
+        assigned = consumer.assignment()
+        offsets = {
+            TopicPartition(topic, partition): offset_and_metadata(offset)
+            for (topic, partition), offset in offsets.items()
+            if TopicPartition(topic, partition) in assigned
+        }
+        if not offsets:
+            return True
+    try:
+        consumer.commit(offsets)
+        return True
+    except CommitFailedError as e:
+        # The partitions were reassigned: their new owner consumes again from the last commit
+        logging.warning(f"Offsets not committed: {e}")
+        return False
+
+
+class BatchStats:
+    """Counts micro-batches, messages and offset commits."""
+
+    def __init__(self):
+        self.batches = 0
+        self.messages = 0
+        self.decode_errors = 0
+        self.commits = 0
+        self.rewinds = 0
+
+    def report(self):
+        summary = {
+            'batches': self.batches,
+            'messages': self.messages,
+            'decode_errors': self.decode_errors,
+            'commits': self.commits,
+            'rewinds': self.rewinds,
+            'average_batch': round(self.messages / self.batches, 1) if self.batches else None,
+        }
+        logging.info(
+            f"Consumed {summary['messages']} messages in {summary['batches']} batches "
+            f"(average {summary['average_batch']}), {summary['decode_errors']} undecodable; "
+            f"{summary['commits']} commits, {summary['rewinds']} rewinds."
+        )
+        return summary
+
+
+def run_micro_batches(consumer, indexer, max_records=DEFAULT_MAX_RECORDS, batch_timeout=DEFAULT_BATCH_TIMEOUT,
+                      error_backoff=DEFAULT_ERROR_BACKOFF, report_interval=REPORT_INTERVAL, stats=None,
+                      aggregator=None, index_raw=True, should_stop=None):
+    """Consume the topic in micro-batches, committing offsets only once a batch is indexed.
+
+    Each batch is decoded, handed to the BulkIndexer and flushed; the
+    offsets are committed after the flush, so a reading is never marked as
+    consumed before it reached Elasticsearch (at-least-once delivery).
+    Undecodable messages and documents Elasticsearch rejects for good are
+    skipped. If documents still fail after the indexer retries, the
+    consumer rewinds to the committed offsets and consumes the batch again.
+    Readings are indexed under their topic-partition-offset ID, so consuming
+    them again overwrites their documents instead of duplicating them.
+
+    With a WindowAggregator, readings are also rolled up per sensor and
+    window; closed windows are indexed with the batch, and offsets are only
+    committed up to the first reading of the windows still open, so a
+    restart rebuilds them. `index_raw=False` indexes the rollups alone.
+
+    The loop runs until `should_stop()` returns True, checked between
+    batches so the current one is indexed and committed first.
+    """
+    stats = stats or BatchStats()
+    last_report = time.monotonic()
+    while not (should_stop and should_stop()):
+        batch = assigned_only(consumer, poll_batch(consumer, max_records, batch_timeout))
+        if batch:
+            stats.batches += 1
+            stats.messages += len(batch)
+            for message in batch:
+                sensor_data = decode_message(message)
+                if sensor_data is None:
+                    stats.decode_errors += 1
+                    continue
+                if index_raw:
+                    indexer.add(reading_document(sensor_data),
+                                reading_id(message.topic, message.partition, message.offset))
+                if aggregator is not None:
+                    aggregator.add(sensor_data, (message.topic, message.partition), message.offset)
+            if aggregator is not None:
+                for action in aggregator.close_ready():
+                    indexer.add_action(action)
+
+            try:
+                indexer.flush()
+            except IndexingError as e:
+                logging.error(f"{e} Consuming again from the committed offsets in {error_backoff}s.")
+                stats.rewinds += 1
+                time.sleep(error_backoff)
+                rewind(consumer)
+                if aggregator is not None:
+                    # The replay rebuilds the windows from their first reading
+                    aggregator.reset()
+                continue
+            offsets = held_positions(consumer, aggregator.held_offsets()) if aggregator is not None else None
+            if commit(consumer, offsets):
+                stats.commits += 1
+
+        if time.monotonic() - last_report >= report_interval:
+            stats.report()
+            indexer.report()
+            if aggregator is not None:
+                aggregator.report()
+            last_report = time.monotonic()
+    return stats
+
+
+def consumer_lag(topic=DEFAULT_TOPIC, bootstrap_servers=DEFAULT_BOOTSTRAP_SERVERS, group_id=DEFAULT_GROUP_ID):
+    """Committed-offset lag per partition and member count of the consumer group."""
+    from kafka import KafkaAdminClient, KafkaConsumer, TopicPartition
+
+    admin = KafkaAdminClient(bootstrap_servers=bootstrap_servers)
+    consumer = KafkaConsumer(bootstrap_servers=bootstrap_servers)
+    try:
+        committed = admin.list_consumer_group_offsets(group_id)
+        group = admin.describe_consumer_groups([group_id])[0]
+        partitions = [TopicPartition(topic, partition) for partition in consumer.partitions_for_topic(topic) or ()]
+        end_offsets = consumer.end_offsets(partitions)
+        beginning_offsets = consumer.beginning_offsets(partitions)
+    finally:
+        consumer.close()
+        admin.close()
+
+    lag = {}
+    for partition in partitions:
+        # Nothing committed yet: the group would start from the earliest offset
+        offset = committed[partition].offset if partition in committed else beginning_offsets[partition]
+        lag[partition.partition] = max(end_offsets[partition] - offset, 0)
+    return {
+        'group_state': group.state,
+        'members': len(group.members),
+        'partitions': len(partitions),
+        'lag': lag,
+        'total_lag': sum(lag.values()),
+    }
@@ -0,0 +1,188 @@
+import json
+import logging
+import time
+from datetime import datetime, timezone
+
+
+DEFAULT_INDEX = 'sensor_data'
+
+# Flush the buffer when any limit is reached
+DEFAULT_MAX_DOCS = 1000
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024
+DEFAULT_MAX_INTERVAL = 1.0
+
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_INITIAL_BACKOFF = 0.5
+
+# Item statuses worth retrying: throttling, unavailable shards, gateway errors;
+# None is a whole request that failed at the transport level
+RETRYABLE_STATUSES = {429, 502, 503, 504, None}
+
+# Number of failed items logged individually per flush
+MAX_LOGGED_FAILURES = 5
+
+
+class IndexingError(Exception):
+    """Documents still rejected with a retryable status once the retries are exhausted."""
+
+
+def iso_timestamp(timestamp_ms):
+    """Epoch milliseconds as an ISO 8601 timestamp (UTC)."""
+    return datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc).isoformat(timespec='milliseconds')
+
+
+def reading_document(sensor_data):
+    """Elasticsearch document of a decoded reading, timestamp in ISO 8601 (UTC)."""
+    return {
+        'sensor_id': sensor_data['sensor_id'],
+        'temperature': sensor_data['temperature'],
+        'humidity': sensor_data['humidity'],
+        'timestamp': iso_timestamp(sensor_data['timestamp_ms']),
+    }
+
+
+def reading_id(topic, partition, offset):
+    """Document ID of the reading at a topic offset: a replay overwrites the document instead of duplicating it."""
+    return f'{topic}-{partition}-{offset}'
+
+
+class BulkIndexer:
+    """Buffers documents and indexes them through the Elasticsearch _bulk API.
+
+    The buffer is flushed when it holds `max_docs` documents, `max_bytes`
+    bytes, or when its oldest document has waited `max_interval` seconds
+    (checked on each add and by ``flush_if_due``). Items rejected with a
+    retryable status are resent alone, with exponential backoff, up to
+    `max_retries` times, then ``flush`` raises IndexingError; other
+    failures (e.g. mapping errors) are counted and logged.
+    """
+
+    def __init__(self, es, index=DEFAULT_INDEX, max_docs=DEFAULT_MAX_DOCS, max_bytes=DEFAULT_MAX_BYTES,
+                 max_interval=DEFAULT_MAX_INTERVAL, max_retries=DEFAULT_MAX_RETRIES,
+                 initial_backoff=DEFAULT_INITIAL_BACKOFF, threads=1):
+        self.es = es
+        self.index = index
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        self.max_interval = max_interval
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.threads = threads
+        self.buffer = []
+        self.buffer_bytes = 0
+        self.buffer_started = None
+        self.started = time.monotonic()
+        self.indexed = 0
+        self.failed = 0
+        self.retried = 0
+        self.flushes = 0
+        self.flush_seconds = []
+
+    def add(self, document, doc_id=None):
+        """Buffer a document for the index, under `doc_id` if given; returns True if this triggered a flush."""
+        action = {'_index': self.index, '_source': document}
+        if doc_id is not None:
+            action['_id'] = doc_id
+        return self.add_action(action)
+
+    def add_action(self, action):
+        """Buffer any bulk action (index, update, ...); returns True if this triggered a flush."""
+        if not self.buffer:
+            self.buffer_started = time.monotonic()
+        self.buffer.append(action)
+        self.buffer_bytes += len(json.dumps(action))
+        if len(self.buffer) >= self.max_docs or self.buffer_bytes >= self.max_bytes:
+            self.flush()
+            return True
+        return self.flush_if_due()
+
+    def flush_if_due(self):
+        if self.buffer and time.monotonic() - self.buffer_started >= self.max_interval:
+            self.flush()
+            return True
+        return False
+
+    def flush(self):
+        """Index the buffered documents, retrying failed items; returns the number indexed."""
+        if not self.buffer:
+            return 0
+        actions, self.buffer, self.buffer_bytes = self.buffer, [], 0
+        started = time.monotonic()
+
+        indexed = 0
+        exhausted = 0
+        backoff = self.initial_backoff
+        for attempt in range(self.max_retries + 1):
+            failures = self._send(actions)
+            indexed += len(actions) - len(failures)
+            retryable = [action for action, status, _ in failures if status in RETRYABLE_STATUSES]
+            dropped = [(status, error) for _, status, error in failures if status not in RETRYABLE_STATUSES]
+            self._drop(dropped)
+            if not retryable:
+                break
+            if attempt == self.max_retries:
+                exhausted = len(retryable)
+                self.failed += exhausted
+                break
+            self.retried += len(retryable)
+            logging.warning(f"Retrying {len(retryable)} documents in {backoff:.1f}s.")
+            time.sleep(backoff)
+            backoff *= 2
+            actions = retryable
+
+        elapsed = time.monotonic() - started
+        self.flushes += 1
+        self.flush_seconds.append(elapsed)
+        self.indexed += indexed
+        if exhausted:
+            raise IndexingError(f"{exhausted} documents not indexed after {self.max_retries} retries.")
+        return indexed
+
+    def _send(self, actions):
+        """Send one _bulk round; returns the failed actions as (action, status, error)."""
+        from elasticsearch import helpers
+
+        options = {'raise_on_error': False, 'raise_on_exception': False}
+        if self.threads > 1:
+            results = helpers.parallel_bulk(self.es, actions, thread_count=self.threads,
+                                            chunk_size=self.max_docs, max_chunk_bytes=self.max_bytes, **options)
+        else:
+            # Retries are handled per item by flush(); results come back in action order
+            results = helpers.streaming_bulk(self.es, actions, chunk_size=self.max_docs,
+                                             max_chunk_bytes=self.max_bytes, max_retries=0, **options)
+
+        failures = []
+        for action, (ok, item) in zip(actions, results):
+            if not ok:
+                result = next(iter(item.values()))
+                status = result.get('status')
+                failures.append((action, status if isinstance(status, int) else None, result.get('error')))
+        return failures
+
+    def _drop(self, failures):
+        for status, error in failures[:MAX_LOGGED_FAILURES]:
+            logging.error(f"Failed to index document ({status}): {error}")
+        self.failed += len(failures)
+
+    def report(self):
+        """Log and return docs/sec and flush latency statistics."""
+        elapsed = time.monotonic() - self.started
+        latencies = sorted(self.flush_seconds)
+        p99 = latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))] if latencies else None
+        summary = {
+            'indexed': self.indexed,
+            'failed': self.failed,
+            'retried': self.retried,
+            'flushes': self.flushes,
+            'docs_per_second': round(self.indexed / elapsed, 1) if elapsed > 0 else None,
+            'flush_latency_avg_ms': round(sum(latencies) / len(latencies) * 1000, 1) if latencies else None,
+            'flush_latency_p99_ms': round(p99 * 1000, 1) if latencies else None,
+            'flush_latency_max_ms': round(latencies[-1] * 1000, 1) if latencies else None,
+        }
+        logging.info(
+            f"Indexed {summary['indexed']} documents in {summary['flushes']} bulk flushes "
+            f"({summary['docs_per_second']} docs/s), {summary['failed']} failed, {summary['retried']} retried; "
+            f"flush latency avg {summary['flush_latency_avg_ms']} ms, p99 {summary['flush_latency_p99_ms']} ms, "
+            f"max {summary['flush_latency_max_ms']} ms."
+        )
+        return summary
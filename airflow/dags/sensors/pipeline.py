@@ -0,0 +1,345 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+from sensors.consumer import (
+    DEFAULT_BATCH_TIMEOUT,
+    DEFAULT_ERROR_BACKOFF,
+    DEFAULT_MAX_RECORDS,
+    REPORT_INTERVAL,
+    assigned_only,
+    commit,
+    decode_message,
+    rewind,
+)
+from sensors.indexer import IndexingError, reading_document, reading_id
+
+
+# Batches waiting between two stages; a full queue pauses the stage feeding it
+DEFAULT_QUEUE_SIZE = 4
+
+# Poll timeout while the partitions are paused: polling keeps the consumer in its group
+PAUSED_POLL_MS = 100
+
+# Longest poll while a batch fills up: the batches indexed meanwhile are committed between polls
+POLL_SLICE_MS = 50
+
+# Latest samples kept per stage for the percentiles
+LATENCY_SAMPLES = 10000
+
+_STOP = None
+
+
+class Batch:
+    """A micro-batch on its way through the stages."""
+
+    __slots__ = ('generation', 'messages', 'offsets', 'documents', 'fetched', 'queued')
+
+    def __init__(self, generation, messages):
+        self.generation = generation
+        self.messages = messages
+        self.documents = None
+        self.fetched = time.monotonic()
+        self.queued = self.fetched
+        # Next offset to read per partition once the batch is indexed
+        self.offsets = {}
+        for message in messages:
+            self.offsets[(message.topic, message.partition)] = message.offset + 1
+
+
+class Latency:
+    """Count, total, max and recent samples of a duration."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.samples = deque(maxlen=LATENCY_SAMPLES)
+
+    def record(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.maximum = max(self.maximum, seconds)
+        self.samples.append(seconds)
+
+    def summary(self):
+        if not self.count:
+            return None
+        samples = sorted(self.samples)
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total / self.count * 1000, 2),
+            'p50_ms': round(samples[len(samples) // 2] * 1000, 2),
+            'p99_ms': round(samples[min(len(samples) - 1, int(0.99 * len(samples)))] * 1000, 2),
+            'max_ms': round(self.maximum * 1000, 2),
+        }
+
+
+class PipelineStats:
+    """Per-stage latency, queue waits and depths, backpressure time and commits."""
+
+    STAGES = ('fetch', 'decode', 'index', 'commit', 'end_to_end')
+    QUEUES = ('decode_queue', 'index_queue', 'done_queue')
+
+    def __init__(self):
+        self.latency = {name: Latency() for name in self.STAGES + self.QUEUES}
+        self.depths = {name: [0, 0, 0] for name in self.QUEUES[:2]}  # samples, total, max
+        self.messages = 0
+        self.decode_errors = 0
+        self.commits = 0
+        self.rewinds = 0
+        self.discarded = 0
+        self.paused_seconds = 0.0
+
+    def sample_depth(self, name, depth):
+        sample = self.depths[name]
+        sample[0] += 1
+        sample[1] += depth
+        sample[2] = max(sample[2], depth)
+
+    def report(self):
+        summary = {
+            'messages': self.messages,
+            'decode_errors': self.decode_errors,
+            'commits': self.commits,
+            'rewinds': self.rewinds,
+            'discarded_batches': self.discarded,
+            'paused_seconds': round(self.paused_seconds, 3),
+            'latency': {name: latency.summary() for name, latency in self.latency.items()},
+            'queue_depth': {
+                name: {'avg': round(total / samples, 2) if samples else None, 'max': maximum}
+                for name, (samples, total, maximum) in self.depths.items()
+            },
+        }
+        stages = ', '.join(
+            f"{name} avg {latency['avg_ms']} / p99 {latency['p99_ms']} ms"
+            for name, latency in summary['latency'].items() if latency
+        )
+        depths = ', '.join(
+            f"{name} avg {depth['avg']} max {depth['max']}" for name, depth in summary['queue_depth'].items()
+        )
+        logging.info(
+            f"Pipeline: {summary['messages']} messages, {summary['decode_errors']} undecodable, "
+            f"{summary['commits']} commits, {summary['rewinds']} rewinds, paused {summary['paused_seconds']}s "
+            f"by backpressure; {stages}; queue depth {depths}."
+        )
+        return summary
+
+
+class PipelinedConsumer:
+    """Fetch, decode and index stages running concurrently, joined by bounded queues.
+
+    The calling thread fetches micro-batches and commits their offsets (the
+    KafkaConsumer is not thread-safe); decoding and indexing each run in
+    their own thread. When Elasticsearch slows down the queues fill up and
+    the fetch stage pauses its partitions, still polling so the consumer
+    keeps its group membership, until the index stage catches up.
+
+    Batches complete in order; their offsets are committed once indexed
+    (at-least-once, as in micro-batch mode). When documents still fail
+    after the indexer retries, the batches in flight are discarded and the
+    consumer rewinds to the committed offsets; readings are indexed under
+    their topic-partition-offset ID, so the replay does not duplicate them.
+    """
+
+    def __init__(self, indexer, max_records=DEFAULT_MAX_RECORDS, batch_timeout=DEFAULT_BATCH_TIMEOUT,
+                 queue_size=DEFAULT_QUEUE_SIZE, error_backoff=DEFAULT_ERROR_BACKOFF,
+                 report_interval=REPORT_INTERVAL, stats=None):
+        self.indexer = indexer
+        self.max_records = max_records
+        self.batch_timeout = batch_timeout
+        self.error_backoff = error_backoff
+        self.report_interval = report_interval
+        self.stats = stats or PipelineStats()
+        self.decode_queue = queue.Queue(queue_size)
+        self.index_queue = queue.Queue(queue_size)
+        self.done_queue = queue.Queue()
+        self.consumer = None
+        self.generation = 0
+        # Generation of the last batch the index stage failed, set by the index thread
+        self.failed_generation = -1
+        self.in_flight = 0
+        self.paused = False
+
+    def run(self, consumer, should_stop=None):
+        """Consume until `should_stop()` returns True, then index and commit the batches in flight."""
+        self.consumer = consumer
+        threads = [
+            threading.Thread(target=self._stage, args=(self._decode, self.decode_queue), name='decode', daemon=True),
+            threading.Thread(target=self._stage, args=(self._index, self.index_queue), name='index', daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+
+        last_report = time.monotonic()
+        try:
+            while not (should_stop and should_stop()):
+                self._complete()
+                self.stats.sample_depth('decode_queue', self.decode_queue.qsize())
+                self.stats.sample_depth('index_queue', self.index_queue.qsize())
+                if time.monotonic() - last_report >= self.report_interval:
+                    self.stats.report()
+                    self.indexer.report()
+                    last_report = time.monotonic()
+
+                if self.decode_queue.full():
+                    # Pause on each poll: partitions assigned by a rebalance start unpaused
+                    consumer.pause(*consumer.assignment())
+                    self.paused = True
+                    started = time.monotonic()
+                    records = consumer.poll(timeout_ms=PAUSED_POLL_MS)
+                    self.stats.paused_seconds += time.monotonic() - started
+                    self._submit(assigned_only(consumer, [message for messages in records.values()
+                                                          for message in messages]))
+                    continue
+                self._resume()
+
+                started = time.monotonic()
+                messages = assigned_only(consumer, self._poll_batch())
+                if messages:
+                    self.stats.latency['fetch'].record(time.monotonic() - started)
+                self._submit(messages)
+        finally:
+            self._shutdown(threads)
+        return self.stats
+
+    def drain(self):
+        """Wait for the batches in flight and commit them (before a rebalance or on shutdown)."""
+        while self.in_flight:
+            self._complete(timeout=0.1)
+
+    def _poll_batch(self):
+        """poll_batch in short polls, committing the batches indexed in between."""
+        batch = []
+        generation = self.generation
+        deadline = time.monotonic() + self.batch_timeout
+        while len(batch) < self.max_records:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            records = self.consumer.poll(timeout_ms=min(int(remaining * 1000), POLL_SLICE_MS),
+                                         max_records=self.max_records - len(batch))
+            for messages in records.values():
+                batch.extend(messages)
+            self._complete()
+            if self.generation != generation:
+                # Rewound in the meantime: these messages are consumed again from the committed offsets
+                return []
+        return batch
+
+    def _submit(self, messages):
+        if not messages:
+            return
+        self.stats.messages += len(messages)
+        self.in_flight += 1
+        self.decode_queue.put(Batch(self.generation, messages))
+
+    def _resume(self):
+        if self.paused:
+            self.consumer.resume(*self.consumer.paused())
+            self.paused = False
+
+    def _shutdown(self, threads):
+        # Let the stages finish what they hold, then stop them in order
+        if threads[0].is_alive():
+            while True:
+                try:
+                    self.decode_queue.put(_STOP, timeout=0.1)
+                    break
+                except queue.Full:
+                    self._complete()
+        while any(thread.is_alive() for thread in threads):
+            self._complete(timeout=0.1)
+        self._complete()
+
+    def _complete(self, timeout=None):
+        """Handle the batches the index stage finished, committing the indexed ones together."""
+        offsets = {}
+        try:
+            outcome, batch, error = self.done_queue.get(timeout=timeout) if timeout else self.done_queue.get_nowait()
+            while True:
+                self.in_flight -= 1
+                self.stats.latency['done_queue'].record(time.monotonic() - batch.queued)
+                if outcome == 'fatal':
+                    raise error
+                if outcome == 'indexed' and batch.generation == self.generation:
+                    offsets.update(batch.offsets)
+                    self.stats.latency['end_to_end'].record(time.monotonic() - batch.fetched)
+                elif outcome == 'failed' and batch.generation == self.generation:
+                    self._rewind(error)
+                else:
+                    self.stats.discarded += 1
+                outcome, batch, error = self.done_queue.get_nowait()
+        except queue.Empty:
+            pass
+
+        if offsets:
+            started = time.monotonic()
+            if commit(self.consumer, offsets):
+                self.stats.commits += 1
+            self.stats.latency['commit'].record(time.monotonic() - started)
+
+    def _rewind(self, error):
+        # Batches fetched after the failed one are dropped by the stages, then consumed again
+        logging.error(f"{error} Consuming again from the committed offsets in {self.error_backoff}s.")
+        self.generation += 1
+        self.stats.rewinds += 1
+        time.sleep(self.error_backoff)
+        rewind(self.consumer)
+
+    def _stage(self, handle, inbox):
+        """Run a stage until it receives the stop marker, forwarding it downstream."""
+        while True:
+            batch = inbox.get()
+            if batch is _STOP:
+                if handle == self._decode:
+                    self.index_queue.put(_STOP)
+                return
+            self.stats.latency[f'{handle.__name__[1:]}_queue'].record(time.monotonic() - batch.queued)
+            try:
+                handle(batch)
+            except Exception as e:
+                # Unexpected error: surface it in the fetch thread rather than stalling the pipeline
+                self.done_queue.put(('fatal', batch, e))
+
+    def _decode(self, batch):
+        if batch.generation != self.generation:
+            self._finish(batch, 'discarded')
+            return
+        started = time.monotonic()
+        documents = []
+        for message in batch.messages:
+            sensor_data = decode_message(message)
+            if sensor_data is None:
+                self.stats.decode_errors += 1
+                continue
+            documents.append((reading_id(message.topic, message.partition, message.offset),
+                              reading_document(sensor_data)))
+        batch.documents = documents
+        self.stats.latency['decode'].record(time.monotonic() - started)
+        batch.queued = time.monotonic()
+        # Blocks while the index stage is behind: this is the backpressure
+        self.index_queue.put(batch)
+
+    def _index(self, batch):
+        # After a failure, skip the following batches without waiting for the fetch thread to rewind
+        if batch.generation != self.generation or batch.generation <= self.failed_generation:
+            self._finish(batch, 'discarded')
+            return
+        started = time.monotonic()
+        try:
+            for doc_id, document in batch.documents:
+                self.indexer.add(document, doc_id)
+            self.indexer.flush()
+        except IndexingError as e:
+            self.failed_generation = batch.generation
+            self._finish(batch, 'failed', e)
+            return
+        self.stats.latency['index'].record(time.monotonic() - started)
+        self._finish(batch, 'indexed')
+
+    def _finish(self, batch, outcome, error=None):
+        batch.queued = time.monotonic()
+        self.done_queue.put((outcome, batch, error))
@@ -0,0 +1,235 @@
+import logging
+import multiprocessing
+import random
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from sensors.codec import ENCODERS, message_headers
+
+
+DEFAULT_TOPIC = 'sensor_data'
+DEFAULT_BOOTSTRAP_SERVERS = 'localhost:9092'
+
+# KafkaProducer tuning: wait up to linger_ms to fill batch_size bytes per
+# partition, and compress whole batches rather than single messages
+DEFAULT_LINGER_MS = 20
+DEFAULT_BATCH_SIZE = 64 * 1024
+DEFAULT_COMPRESSION_TYPE = 'gzip'
+
+# Number of delivery errors logged individually, the rest are only counted
+MAX_LOGGED_ERRORS = 10
+
+
+# Function to simulate sensor data
+def generate_sensor_data(id):
+    sensor_data = {
+        "sensor_id": id,
+        "temperature": round(random.uniform(29.0, 30.0), 2),  # Random temperature between 20.0 and 30.0 degrees
+        "humidity": round(random.uniform(50.0, 51.0), 2),     # Random humidity between 30.0% and 60.0%
+        "timestamp_ms": time.time_ns() // 1_000_000,  # Epoch milliseconds, formatted only by the JSON encoder
+    }
+    return sensor_data
+
+
+def make_producer(bootstrap_servers=DEFAULT_BOOTSTRAP_SERVERS, linger_ms=DEFAULT_LINGER_MS,
+                  batch_size=DEFAULT_BATCH_SIZE, compression_type=DEFAULT_COMPRESSION_TYPE, acks=1, **config):
+    """KafkaProducer configured for batched, compressed, asynchronous sends."""
+    from kafka import KafkaProducer
+
+    return KafkaProducer(
+        bootstrap_servers=bootstrap_servers,
+        linger_ms=linger_ms,
+        batch_size=batch_size,
+        compression_type=compression_type or None,
+        acks=acks,
+        **config
+    )
+
+
+class DeliveryStats:
+    """Counts sends and their asynchronous delivery reports.
+
+    Callbacks run on the producer's network thread, hence the lock.
+    """
+
+    def __init__(self):
+        self.sent = 0
+        self.delivered = 0
+        self.errors = 0
+        self.bytes = 0
+        self.started = time.monotonic()
+        self.send_finished = None
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def on_delivery(self, metadata):
+        with self._lock:
+            self.delivered += 1
+
+    def on_error(self, error):
+        with self._lock:
+            self.errors += 1
+            errors = self.errors
+        if errors <= MAX_LOGGED_ERRORS:
+            logging.error(f"Delivery failed: {error!r}")
+
+    def report(self):
+        """Log and return the achieved throughput and delivery outcome."""
+        finished = self.finished or time.monotonic()
+        send_seconds = (self.send_finished or finished) - self.started
+        total_seconds = finished - self.started
+        summary = {
+            'sent': self.sent,
+            'delivered': self.delivered,
+            'errors': self.errors,
+            'undelivered': self.sent - self.delivered - self.errors,
+            'bytes': self.bytes,
+            'send_seconds': round(send_seconds, 3),
+            'total_seconds': round(total_seconds, 3),
+            'send_rate': round(self.sent / send_seconds, 1) if send_seconds > 0 else None,
+            'delivered_rate': round(self.delivered / total_seconds, 1) if total_seconds > 0 else None,
+        }
+        logging.info(
+            f"Sent {summary['sent']} messages ({summary['bytes']} bytes) in {summary['send_seconds']}s "
+            f"({summary['send_rate']} msg/s); delivered {summary['delivered']} in {summary['total_seconds']}s "
+            f"({summary['delivered_rate']} msg/s), {summary['errors']} errors, "
+            f"{summary['undelivered']} unacknowledged."
+        )
+        return summary
+
+
+def run_generator(producer, topic=DEFAULT_TOPIC, messages_per_second=1.0, sensor_ids=range(1, 6),
+                  duration_seconds=60, wire_format='json', flush_timeout=30, stats=None):
+    """Send generated readings for `sensor_ids` at a target rate for `duration_seconds`.
+
+    Messages are sent in bursts of whatever is due since the start, so the
+    rate holds at thousands of messages per second without a sleep per
+    message. Each message is keyed by its sensor_id: the default partitioner
+    sends a sensor to a single partition, which keeps its readings in order.
+    Payloads are encoded in `wire_format` (see sensors.codec), announced by
+    message headers. Sends are asynchronous; delivery is tracked through
+    callbacks and the producer is flushed at the end. Returns the
+    DeliveryStats.
+    """
+    stats = stats or DeliveryStats()
+    interval = 1.0 / messages_per_second
+    deadline = stats.started + duration_seconds
+    keys = {sensor_id: str(sensor_id).encode('utf-8') for sensor_id in sensor_ids}
+    serialize = ENCODERS[wire_format]
+    headers = message_headers(wire_format)
+    position = 0
+
+    while True:
+        now = time.monotonic()
+        if now >= deadline:
+            break
+
+        due = int((now - stats.started) * messages_per_second) + 1 - stats.sent
+        if due <= 0:
+            # Sleep until the next message is due (or the run ends)
+            time.sleep(min(stats.started + stats.sent * interval - now, deadline - now))
+            continue
+
+        for _ in range(due):
+            sensor_id = sensor_ids[position % len(sensor_ids)]
+            position += 1
+            payload = serialize(generate_sensor_data(sensor_id))
+            try:
+                future = producer.send(topic, key=keys[sensor_id], value=payload, headers=headers)
+            except Exception as e:
+                # Buffer full for longer than max_block_ms, or producer closed
+                stats.on_error(e)
+                stats.sent += 1
+                continue
+            future.add_callback(stats.on_delivery)
+            future.add_errback(stats.on_error)
+            stats.sent += 1
+            stats.bytes += len(payload)
+
+    stats.send_finished = time.monotonic()
+    try:
+        producer.flush(timeout=flush_timeout)
+    except Exception as e:
+        # Messages still unacknowledged are reported as such
+        logging.error(f"Flush did not complete within {flush_timeout}s: {e!r}")
+    stats.finished = time.monotonic()
+    return stats
+
+
+def sensor_ranges(sensor_count, parts, first_sensor_id=1):
+    """Split sensor IDs into at most `parts` contiguous, non-empty [start, stop) ranges."""
+    parts = max(1, min(parts, sensor_count))
+    size, extra = divmod(sensor_count, parts)
+    ranges = []
+    start = first_sensor_id
+    for index in range(parts):
+        stop = start + size + (1 if index < extra else 0)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+def run_worker(config):
+    """Produce the readings of one sensor range in this process and return its report.
+
+    `config` holds the KafkaProducer settings (`producer`), the topic, the
+    range (`sensor_start`, `sensor_stop`), its share of the target rate and
+    the duration.
+    """
+    logging.basicConfig(level=logging.INFO)
+    producer = make_producer(**config['producer'])
+    try:
+        stats = run_generator(
+            producer,
+            topic=config['topic'],
+            messages_per_second=config['messages_per_second'],
+            sensor_ids=range(config['sensor_start'], config['sensor_stop']),
+            duration_seconds=config['duration_seconds'],
+            wire_format=config.get('wire_format', 'json'),
+        )
+    finally:
+        producer.close()
+    return dict(stats.report(), sensor_start=config['sensor_start'], sensor_stop=config['sensor_stop'])
+
+
+def run_processes(config, processes):
+    """Split the sensor range of `config` across `processes` producer processes.
+
+    Each process gets its own KafkaProducer and a share of the target rate
+    proportional to its number of sensors. Returns the per-process reports.
+    """
+    sensor_count = config['sensor_stop'] - config['sensor_start']
+    shards = [
+        dict(config, sensor_start=start, sensor_stop=stop,
+             messages_per_second=config['messages_per_second'] * (stop - start) / sensor_count)
+        for start, stop in sensor_ranges(sensor_count, processes, config['sensor_start'])
+    ]
+    if len(shards) == 1:
+        return [run_worker(shards[0])]
+
+    # "spawn": the Airflow task process runs heartbeat threads, forking it is unsafe
+    with ProcessPoolExecutor(max_workers=len(shards), mp_context=multiprocessing.get_context('spawn')) as executor:
+        return list(executor.map(run_worker, shards))
+
+
+def aggregate_reports(reports):
+    """Combine worker reports; rates are computed over the longest worker run."""
+    totals = {name: sum(report[name] for report in reports)
+              for name in ('sent', 'delivered', 'errors', 'undelivered', 'bytes')}
+    send_seconds = max((report['send_seconds'] for report in reports), default=0)
+    total_seconds = max((report['total_seconds'] for report in reports), default=0)
+    summary = dict(
+        totals,
+        workers=len(reports),
+        send_seconds=send_seconds,
+        total_seconds=total_seconds,
+        send_rate=round(totals['sent'] / send_seconds, 1) if send_seconds > 0 else None,
+        delivered_rate=round(totals['delivered'] / total_seconds, 1) if total_seconds > 0 else None,
+    )
+    logging.info(
+        f"{summary['workers']} producers sent {summary['sent']} messages ({summary['bytes']} bytes) at "
+        f"{summary['send_rate']} msg/s; delivered {summary['delivered']} at {summary['delivered_rate']} msg/s, "
+        f"{summary['errors']} errors, {summary['undelivered']} unacknowledged."
+    )
+    return summary
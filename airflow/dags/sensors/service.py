@@ -0,0 +1,217 @@
+"""Standalone sensor consumer service.
+
+Runs `--processes` consumer processes in the `sensor-group` consumer group,
+each indexing its partitions into Elasticsearch in micro-batches. Kafka
+spreads the topic partitions over every member, so throughput scales with
+the partition count, across processes and across hosts or containers
+running the service. SIGTERM or SIGINT stops the workers after their
+current batch is indexed and committed.
+
+    cd airflow/dags && python -m sensors.service --processes 4
+"""
+import argparse
+import logging
+import multiprocessing
+import signal
+import time
+
+from sensors.aggregate import DEFAULT_ALLOWED_LATENESS, DEFAULT_WINDOW_SECONDS, WindowAggregator
+from sensors.consumer import (
+    DEFAULT_BATCH_TIMEOUT,
+    DEFAULT_BOOTSTRAP_SERVERS,
+    DEFAULT_GROUP_ID,
+    DEFAULT_MAX_RECORDS,
+    DEFAULT_TOPIC,
+    make_consumer,
+    rebalance_listener,
+    run_micro_batches,
+)
+from sensors.indexer import DEFAULT_MAX_BYTES, DEFAULT_MAX_DOCS, DEFAULT_MAX_RETRIES, BulkIndexer
+from sensors.pipeline import DEFAULT_QUEUE_SIZE, PipelinedConsumer
+
+
+DEFAULT_ES_HOSTS = ['http://43.88.102.118:9200']
+
+# Seconds the workers get to finish their batch on shutdown before being terminated
+DEFAULT_SHUTDOWN_TIMEOUT = 60
+
+# Pause before restarting a worker that exited unexpectedly
+RESTART_BACKOFF = 5
+
+# "micro_batch": fetch, decode, index and commit one batch after the other;
+# "pipelined": the three stages run concurrently (see sensors.pipeline)
+MODES = ('micro_batch', 'pipelined')
+
+DEFAULT_CONFIG = {
+    'topic': DEFAULT_TOPIC,
+    'bootstrap_servers': DEFAULT_BOOTSTRAP_SERVERS,
+    'group_id': DEFAULT_GROUP_ID,
+    'es_hosts': DEFAULT_ES_HOSTS,
+    'mode': 'micro_batch',
+    'queue_size': DEFAULT_QUEUE_SIZE,
+    'max_records': DEFAULT_MAX_RECORDS,
+    'batch_timeout': DEFAULT_BATCH_TIMEOUT,
+    'bulk_max_docs': DEFAULT_MAX_DOCS,
+    'bulk_max_bytes': DEFAULT_MAX_BYTES,
+    'bulk_max_retries': DEFAULT_MAX_RETRIES,
+    'bulk_threads': 1,
+    'aggregate': False,
+    'window_seconds': DEFAULT_WINDOW_SECONDS,
+    'allowed_lateness': DEFAULT_ALLOWED_LATENESS,
+    'index_raw': True,
+}
+
+
+def run_consumer(config, should_stop=None):
+    """Consume and index in this process until `should_stop()`; returns the BatchStats or PipelineStats."""
+    from elasticsearch import Elasticsearch
+
+    config = dict(DEFAULT_CONFIG, **config)
+    if config['mode'] == 'pipelined' and config['aggregate']:
+        raise ValueError("Window aggregation runs in micro_batch mode only.")
+    es = Elasticsearch(config['es_hosts'])
+    aggregator = None
+    if config['aggregate']:
+        aggregator = WindowAggregator(
+            window_seconds=config['window_seconds'],
+            allowed_lateness=config['allowed_lateness'],
+        )
+    indexer = BulkIndexer(
+        es,
+        max_docs=config['bulk_max_docs'],
+        max_bytes=config['bulk_max_bytes'],
+        max_retries=config['bulk_max_retries'],
+        threads=config['bulk_threads'],
+    )
+    pipeline = None
+    if config['mode'] == 'pipelined':
+        pipeline = PipelinedConsumer(
+            indexer,
+            max_records=config['max_records'],
+            batch_timeout=config['batch_timeout'],
+            queue_size=config['queue_size'],
+        )
+    # Batches in flight are indexed and committed before their partitions are handed over
+    listener = rebalance_listener(aggregator, on_revoked=pipeline.drain if pipeline is not None else None)
+    consumer = make_consumer(config['topic'], config['bootstrap_servers'], config['group_id'], listener=listener)
+    try:
+        if pipeline is not None:
+            stats = pipeline.run(consumer, should_stop=should_stop)
+        else:
+            stats = run_micro_batches(
+                consumer,
+                indexer,
+                max_records=config['max_records'],
+                batch_timeout=config['batch_timeout'],
+                aggregator=aggregator,
+                index_raw=config['index_raw'],
+                should_stop=should_stop,
+            )
+        stats.report()
+        return stats
+    finally:
+        indexer.report()
+        if aggregator is not None:
+            # Open windows are not indexed: their offsets were not committed, the next run rebuilds them
+            aggregator.report()
+        # Leaving the group right away lets the others take the partitions over without waiting for a timeout
+        consumer.close(autocommit=False)
+
+
+def run_worker(config, stop_event):
+    """Entry point of a worker process."""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(processName)s %(levelname)s %(message)s')
+    # Shutdown is coordinated by the supervisor through stop_event, so the batch in progress completes
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    run_consumer(config, stop_event.is_set)
+
+
+def serve(config, processes=1, shutdown_timeout=DEFAULT_SHUTDOWN_TIMEOUT):
+    """Run and supervise `processes` worker processes until SIGTERM or SIGINT.
+
+    A worker that exits unexpectedly is restarted; its partitions move to
+    the other members meanwhile.
+    """
+    # "spawn": each worker builds its own Kafka and Elasticsearch clients, nothing is inherited
+    context = multiprocessing.get_context('spawn')
+    stop_event = context.Event()
+
+    stopping = []
+
+    def request_stop(signum, frame):
+        # Only flag it: setting the Event here could deadlock with a wait() in progress on this thread
+        stopping.append(signum)
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    workers = {}
+
+    def start(index):
+        worker = context.Process(target=run_worker, args=(config, stop_event), name=f'sensor-consumer-{index}')
+        worker.start()
+        workers[index] = worker
+
+    for index in range(processes):
+        start(index)
+    logging.info(f"Started {processes} consumers in group '{config.get('group_id', DEFAULT_GROUP_ID)}'.")
+
+    restart_at = {}
+    while not stopping:
+        time.sleep(1)
+        for index, worker in workers.items():
+            if worker.is_alive():
+                continue
+            if index not in restart_at:
+                logging.error(f"{worker.name} exited with code {worker.exitcode}, restarting in {RESTART_BACKOFF}s.")
+                restart_at[index] = time.monotonic() + RESTART_BACKOFF
+            elif time.monotonic() >= restart_at[index]:
+                del restart_at[index]
+                start(index)
+
+    logging.info(f"Received {signal.Signals(stopping[0]).name}, stopping the workers after their current batch.")
+    stop_event.set()
+    deadline = time.monotonic() + shutdown_timeout
+    for worker in workers.values():
+        worker.join(max(deadline - time.monotonic(), 0))
+    for worker in workers.values():
+        if worker.is_alive():
+            logging.warning(f"{worker.name} did not stop within {shutdown_timeout}s, terminating it.")
+            worker.terminate()
+            worker.join()
+    logging.info("Consumers stopped.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=1,
+                        help='consumer processes; more than the partition count leaves some idle')
+    parser.add_argument('--topic', default=DEFAULT_TOPIC)
+    parser.add_argument('--bootstrap-servers', default=DEFAULT_BOOTSTRAP_SERVERS)
+    parser.add_argument('--group-id', default=DEFAULT_GROUP_ID)
+    parser.add_argument('--es-hosts', nargs='+', default=DEFAULT_ES_HOSTS)
+    parser.add_argument('--mode', choices=MODES, default='micro_batch')
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE,
+                        help='batches buffered between pipelined stages')
+    parser.add_argument('--max-records', type=int, default=DEFAULT_MAX_RECORDS, help='messages per micro-batch')
+    parser.add_argument('--batch-timeout', type=float, default=DEFAULT_BATCH_TIMEOUT,
+                        help='seconds to wait for a full micro-batch')
+    parser.add_argument('--bulk-max-docs', type=int, default=DEFAULT_MAX_DOCS)
+    parser.add_argument('--bulk-max-bytes', type=int, default=DEFAULT_MAX_BYTES)
+    parser.add_argument('--bulk-max-retries', type=int, default=DEFAULT_MAX_RETRIES)
+    parser.add_argument('--bulk-threads', type=int, default=1)
+    parser.add_argument('--aggregate', action='store_true', help='index per-sensor window rollups')
+    parser.add_argument('--window-seconds', type=int, default=DEFAULT_WINDOW_SECONDS)
+    parser.add_argument('--allowed-lateness', type=float, default=DEFAULT_ALLOWED_LATENESS)
+    parser.add_argument('--no-raw', dest='index_raw', action='store_false', help='index the rollups only')
+    parser.add_argument('--shutdown-timeout', type=float, default=DEFAULT_SHUTDOWN_TIMEOUT)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(processName)s %(levelname)s %(message)s')
+    config = {name: getattr(args, name) for name in DEFAULT_CONFIG}
+    serve(config, processes=args.processes, shutdown_timeout=args.shutdown_timeout)
+
+
+if __name__ == '__main__':
+    main()
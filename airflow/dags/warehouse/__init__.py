@@ -0,0 +1 @@
+"""Helpers for loading publication data into the MySQL data warehouse."""
@@ -0,0 +1,240 @@
+import logging
+import os
+import tempfile
+
+from warehouse.loader import (
+    content_hash,
+    ensure_dimension_keys,
+    ensure_publication_keys,
+    normalize_entries,
+    publication_key,
+)
+from warehouse.metrics import PipelineMetrics
+from warehouse.quarantine import ensure_quarantine, write_quarantine
+
+
+# Tables de staging temporaires (propres à la connexion de la tâche)
+CREATE_STAGING_SQL = [
+    """
+    CREATE TEMPORARY TABLE stg_publications (
+        Seq INT NOT NULL,
+        Title VARCHAR(255),
+        DOI VARCHAR(100),
+        PublicationDate DATE,
+        Link VARCHAR(255),
+        Abstract TEXT,
+        JournalMain VARCHAR(255) NOT NULL,
+        ISSN VARCHAR(50),
+        JournalQuartils VARCHAR(50),
+        Quartils VARCHAR(50),
+        PublicationKey CHAR(64) NOT NULL,
+        ContentHash CHAR(64) NOT NULL,
+        KEY (JournalMain),
+        KEY (PublicationKey)
+    )
+    """,
+    """
+    CREATE TEMPORARY TABLE stg_authors (
+        AuthorName VARCHAR(100) NOT NULL,
+        KEY (AuthorName)
+    )
+    """,
+    """
+    CREATE TEMPORARY TABLE stg_quartils (
+        JournalMain VARCHAR(255) NOT NULL,
+        annee VARCHAR(4),
+        quartil VARCHAR(255),
+        PublicationKey CHAR(64) NOT NULL,
+        ContentHash CHAR(64) NOT NULL,
+        KEY (JournalMain),
+        KEY (PublicationKey)
+    )
+    """,
+]
+
+# Fusion ensembliste des tables de staging dans les tables finales; les clés
+# étrangères Journal sont résolues par jointure sur JournalMain. INSERT IGNORE:
+# un chargement parallèle peut avoir inséré le même nom depuis la jointure
+MERGE_SQL = [
+    """
+    INSERT IGNORE INTO Authors (AuthorName, Affiliation, Country)
+    SELECT DISTINCT s.AuthorName, NULL, NULL
+    FROM stg_authors s
+    LEFT JOIN Authors a ON a.AuthorName = s.AuthorName
+    WHERE a.AuthorID IS NULL
+    """,
+    """
+    INSERT IGNORE INTO Journal (JournalMain, ISSN, Quartils)
+    SELECT s.JournalMain, MIN(s.ISSN), MIN(s.JournalQuartils)
+    FROM stg_publications s
+    LEFT JOIN Journal j ON j.JournalMain = s.JournalMain
+    WHERE j.JournalID IS NULL
+    GROUP BY s.JournalMain
+    """,
+    # Seules les publications nouvelles ou dont l'empreinte a changé sont écrites, avec
+    # leurs quartils (tables dérivées: évitent les colonnes ambiguës dans l'UPDATE).
+    # <=>: une publication absente, ou chargée avant ContentHash (NULL), est écrite
+    """
+    INSERT INTO Quartils (annee, quartil, id_journal)
+    SELECT c.annee, c.NewQuartil, c.JournalID
+    FROM (
+        SELECT q.annee, q.quartil AS NewQuartil, j.JournalID
+        FROM stg_quartils q
+        JOIN Journal j ON j.JournalMain = q.JournalMain
+        LEFT JOIN Publications p ON p.PublicationKey = q.PublicationKey
+        WHERE NOT (p.ContentHash <=> q.ContentHash)
+    ) AS c
+    ON DUPLICATE KEY UPDATE quartil = c.NewQuartil
+    """,
+    """
+    INSERT INTO Publications (Title, DOI, PublicationDate, Link, Abstract, JournalID, Quartils,
+                              PublicationKey, ContentHash)
+    SELECT c.Title, c.DOI, c.PublicationDate, c.Link, c.Abstract, c.JournalID, c.Quartils,
+           c.PublicationKey, c.ContentHash
+    FROM (
+        SELECT s.Seq, s.Title, s.DOI, s.PublicationDate, s.Link, s.Abstract, j.JournalID, s.Quartils,
+               s.PublicationKey, s.ContentHash
+        FROM stg_publications s
+        JOIN Journal j ON j.JournalMain = s.JournalMain
+        LEFT JOIN Publications p ON p.PublicationKey = s.PublicationKey
+        WHERE NOT (p.ContentHash <=> s.ContentHash)
+    ) AS c
+    ORDER BY c.Seq
+    ON DUPLICATE KEY UPDATE
+        Title = c.Title, DOI = c.DOI, PublicationDate = c.PublicationDate, Link = c.Link,
+        Abstract = c.Abstract, JournalID = c.JournalID, Quartils = c.Quartils, ContentHash = c.ContentHash
+    """,
+]
+
+STAGING_TABLES = ('stg_publications', 'stg_authors', 'stg_quartils')
+
+
+def tsv_value(value):
+    """Encoder une valeur pour LOAD DATA (échappement par défaut, NULL -> \\N)."""
+    if value is None:
+        return '\\N'
+    text = str(value)
+    return (text.replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+class BackfillLoader:
+    """Chargement massif de l'entrepôt pour le premier import et les réimports.
+
+    Les publications normalisées sont écrites dans des fichiers TSV temporaires,
+    importées avec ``LOAD DATA LOCAL INFILE`` dans des tables de staging, puis
+    fusionnées dans les tables finales par quelques requêtes ensemblistes.
+
+    La connexion MySQL doit autoriser ``local_infile`` (extra
+    ``{"local_infile": true}`` de la connexion Airflow, et ``local_infile=ON``
+    côté serveur).
+
+    Le chargement se fait en une seule transaction, sans checkpoint; les
+    enregistrements rejetés sont mis en quarantaine dans cette transaction. Les
+    tables et colonnes manquantes sont créées à l'ouverture: en MySQL, ces
+    instructions valident implicitement la transaction en cours.
+    """
+
+    def __init__(self, mysql_hook, tmp_dir=None, source='unknown', run_id=None, metrics=None):
+        self.mysql_hook = mysql_hook
+        self.tmp_dir = tmp_dir
+        self.source = source
+        self.run_id = run_id
+        self.metrics = metrics or PipelineMetrics(source=source)
+        self.conn = None
+        self.files = {}
+        self.rejected = []  # (enregistrement brut, raison)
+        self.rows = dict.fromkeys(STAGING_TABLES, 0)
+
+    def __enter__(self):
+        self.conn = self.metrics.instrument(self.mysql_hook.get_conn())
+        self.conn.autocommit(False)
+        with self.conn.cursor() as cursor:
+            ensure_publication_keys(cursor)
+            ensure_dimension_keys(cursor)
+            ensure_quarantine(cursor)
+        self.conn.commit()
+        for table in STAGING_TABLES:
+            fd, path = tempfile.mkstemp(prefix=f'{table}_', suffix='.tsv', dir=self.tmp_dir)
+            self.files[table] = (path, os.fdopen(fd, 'w', encoding='utf-8', newline='\n'))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.finish()
+            else:
+                self.conn.rollback()
+        finally:
+            for path, file in self.files.values():
+                file.close()
+                os.remove(path)
+            self.conn.close()
+            self.conn = None
+
+    def load(self, entries):
+        """Convertir et normaliser les enregistrements bruts un par un, puis les écrire dans les fichiers de staging."""
+        self._consume(normalize_entries(entries))
+
+    def load_transformed(self, transformed, entries):
+        """Écrire dans les fichiers de staging un morceau normalisé par transform.transform_chunk."""
+        self._consume((position, entries[position], record, reason) for position, record, reason in transformed)
+
+    def _consume(self, items):
+        with self.metrics.stage('stage_files') as stage:
+            self._stage_records(items, stage)
+
+    def _stage_records(self, items, stage):
+        for _, entry, record, reason in items:
+            stage.count(rows_in=1)
+            if reason is None and not record['journal_main']:
+                reason = 'Publication has no journal'
+            if reason is not None:
+                self.rejected.append((entry, reason))
+                continue
+
+            key, digest = publication_key(record), content_hash(record)
+            self._write('stg_publications', (
+                self.rows['stg_publications'], record['title'], record['doi'], record['publication_date'],
+                record['link'], record['abstract'], record['journal_main'], record['issn'],
+                'indexe' if record['indexed'] else 'pas indexe', record['last_quartil'], key, digest,
+            ))
+            stage.count(rows_out=1)
+            for author_name in record['authors']:
+                self._write('stg_authors', (author_name,))
+            for annee, quartil_value in record['quartils']:
+                self._write('stg_quartils', (record['journal_main'], annee, quartil_value, key, digest))
+
+    def _write(self, table, values):
+        self.files[table][1].write('\t'.join(tsv_value(value) for value in values) + '\n')
+        self.rows[table] += 1
+
+    def finish(self):
+        """Importer les fichiers dans les tables de staging et les fusionner en une transaction."""
+        with self.conn.cursor() as cursor:
+            for statement in CREATE_STAGING_SQL:
+                cursor.execute(statement)
+
+            with self.metrics.stage('load_data') as stage:
+                for table, (path, file) in self.files.items():
+                    file.flush()
+                    cursor.execute(
+                        f"LOAD DATA LOCAL INFILE %s INTO TABLE {table} "
+                        f"CHARACTER SET utf8mb4 FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n'",
+                        (path,)
+                    )
+                    stage.count(rows_in=self.rows[table], rows_out=self.rows[table], bytes=os.path.getsize(path))
+                    logging.info(f"Loaded {self.rows[table]} rows into {table}.")
+
+            with self.metrics.stage('merge') as stage:
+                for statement in MERGE_SQL:
+                    cursor.execute(statement)
+                    stage.count(rows_out=max(cursor.rowcount, 0))
+                    logging.info(f"Merged {cursor.rowcount} rows: {' '.join(statement.split()[:3])}")
+
+            for table in STAGING_TABLES:
+                cursor.execute(f"DROP TEMPORARY TABLE {table}")
+
+            if self.rejected:
+                write_quarantine(cursor, self.source, self.run_id, self.rejected)
+        self.conn.commit()
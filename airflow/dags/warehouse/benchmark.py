@@ -0,0 +1,476 @@
+"""Banc d'essai hors ligne du chargement de l'entrepôt.
+
+Génère des publications synthétiques (documents Mongo et lignes Postgres),
+puis exécute les étapes de chargement de la tâche insert_data_into_data_warehouse
+(staging optionnel, normalisation, résolution des dimensions, écriture par lots)
+contre une base SQLite locale qui émule le dialecte MySQL utilisé par le
+chargeur. Chaque scénario tourne dans un processus neuf pour mesurer son pic
+de mémoire.
+
+Depuis airflow/dags::
+
+    python -m warehouse.benchmark --records 100000 --transform-workers 1 4
+    python -m warehouse.benchmark --json results.json
+    python -m warehouse.benchmark --baseline results.json --tolerance 0.2
+    python -m warehouse.benchmark --check-backfill --records 0
+
+Avec ``--baseline``, le code de sortie est 1 si un scénario est plus lent
+(débit) ou fait plus d'allers-retours que la référence au-delà de la tolérance.
+Avec ``--check-backfill``, il est 1 si les fusions du mode backfill n'écrivent
+pas exactement les publications nouvelles ou modifiées.
+"""
+import argparse
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import random
+import re
+import resource
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+
+from warehouse.backfill import BackfillLoader
+from warehouse.extract import chunked
+from warehouse.loader import WarehouseLoader
+from warehouse.metrics import PipelineMetrics
+from warehouse.staging import read_chunks, write_chunks
+from warehouse.transform import transform_chunk, transform_parallel
+
+
+# Schéma minimal de l'entrepôt, tel que créé hors du chargeur (voir les modèles de
+# REST_API/app.py): les clés de Authors, Journal et Publications sont ajoutées par
+# le chargeur. La clé (annee, id_journal) de Quartils est celle qu'utilise son
+# ON DUPLICATE KEY UPDATE. Les noms sont comparés sans tenir compte de la casse,
+# comme avec la collation par défaut de MySQL
+SQLITE_SCHEMA = """
+    CREATE TABLE Authors (AuthorID INTEGER PRIMARY KEY, AuthorName TEXT NOT NULL COLLATE NOCASE, Affiliation TEXT,
+                          Country TEXT);
+    CREATE TABLE Journal (JournalID INTEGER PRIMARY KEY, JournalMain TEXT NOT NULL COLLATE NOCASE, ISSN TEXT,
+                          Quartils TEXT);
+    CREATE TABLE Quartils (QuartilID INTEGER PRIMARY KEY, annee TEXT NOT NULL, quartil TEXT, id_journal INTEGER,
+                           UNIQUE (annee, id_journal));
+    CREATE TABLE Publications (PublicationID INTEGER PRIMARY KEY, Title TEXT NOT NULL, DOI TEXT,
+                               PublicationDate DATE, Link TEXT, Abstract TEXT, JournalID INTEGER, Quartils TEXT);
+    CREATE TABLE LoadCheckpoints (CheckpointKey TEXT PRIMARY KEY, RecordsDone INTEGER, UpdatedAt TEXT);
+    CREATE TABLE LoadQuarantine (QuarantineID INTEGER PRIMARY KEY, Source TEXT, RunID TEXT, Reason TEXT,
+                                 Record TEXT, CreatedAt TEXT DEFAULT CURRENT_TIMESTAMP, ReplayedAt TEXT);
+"""
+
+# Colonnes de conflit des ON DUPLICATE KEY UPDATE, traduits en ON CONFLICT
+CONFLICT_TARGETS = {
+    'Quartils': 'annee, id_journal',
+    'Publications': 'PublicationKey',
+    'LoadCheckpoints': 'CheckpointKey',
+}
+
+# Premières colonnes des index uniques, comme information_schema.STATISTICS avec SEQ_IN_INDEX = 1
+UNIQUE_COLUMNS_SQL = (
+    "SELECT m.name, i.name FROM sqlite_master m, pragma_index_list(m.name) l, pragma_index_info(l.name) i "
+    "WHERE m.type = 'table' AND l.\"unique\" = 1 AND i.seqno = 0"
+)
+
+# Dates des publications stockées en texte ISO, comme les lit MySQL
+sqlite3.register_adapter(date, date.isoformat)
+
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October',
+          'November', 'December']
+
+
+def translate(sql):
+    """Traduire une requête MySQL du chargeur en SQLite."""
+    if 'CREATE TABLE IF NOT EXISTS' in sql:
+        return 'SELECT 1'  # Tables déjà créées par SQLITE_SCHEMA
+    if 'information_schema.STATISTICS' in sql and 'INDEX_NAME' in sql:
+        index = re.search(r"INDEX_NAME = '(\w+)'", sql).group(1)
+        return f"SELECT COUNT(*) FROM sqlite_master WHERE type = 'index' AND name = '{index}'"
+    if 'information_schema.STATISTICS' in sql:
+        return UNIQUE_COLUMNS_SQL
+    if 'information_schema.COLUMNS' in sql:
+        return "SELECT name FROM pragma_table_info('Publications')"
+    match = re.match(r'\s*ALTER TABLE (\w+) ADD UNIQUE KEY (\w+) \((\w+)\)', sql)
+    if match:
+        return 'CREATE UNIQUE INDEX {1} ON {0} ({2})'.format(*match.groups())
+    if 'CREATE TEMPORARY TABLE' in sql:
+        return re.sub(r',\s*KEY \(\w+\)', '', sql)  # Index secondaires des tables de staging
+    sql = sql.replace('%s', '?').replace('INSERT IGNORE', 'INSERT OR IGNORE')
+    sql = sql.replace('DROP TEMPORARY TABLE', 'DROP TABLE').replace('<=>', 'IS')
+    if 'ON DUPLICATE KEY UPDATE' in sql:
+        head, update = sql.split('ON DUPLICATE KEY UPDATE')
+        table = re.search(r'INSERT INTO (\w+)', head).group(1)
+        update = re.sub(r'VALUES\((\w+)\)', r'excluded.\1', update)
+        # Fusions de backfill: colonne = c.<colonne de la table dérivée c>, dans l'ordre de l'INSERT
+        update = re.sub(r'(\w+) = c\.\w+', r'\1 = excluded.\1', update)
+        if 'SELECT' in head and 'ORDER BY' not in head:
+            head += ' WHERE true'  # Sans clause après FROM, SQLite lirait ON CONFLICT comme une jointure
+        sql = f"{head} ON CONFLICT({CONFLICT_TARGETS[table]}) DO UPDATE SET {update}"
+    return sql
+
+
+def tsv_fields(line):
+    """Décoder une ligne écrite par backfill.tsv_value."""
+    escapes = {'t': '\t', 'n': '\n', 'r': '\r', '\\': '\\'}
+    return [None if field == '\\N' else re.sub(r'\\(.)', lambda match: escapes[match.group(1)], field)
+            for field in line.rstrip('\n').split('\t')]
+
+
+class SQLiteCursor:
+    def __init__(self, conn):
+        self.cursor = conn.cursor()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cursor.close()
+
+    def execute(self, sql, params=()):
+        match = re.match(r'\s*LOAD DATA LOCAL INFILE %s INTO TABLE (\w+)', sql)
+        if match:
+            self.load_data(match.group(1), params[0])
+            return
+        self.cursor.execute(translate(sql), tuple(params or ()))
+
+    def load_data(self, table, path):
+        """LOAD DATA LOCAL INFILE d'un fichier TSV de backfill."""
+        with open(path, encoding='utf-8', newline='\n') as file:
+            rows = [tsv_fields(line) for line in file]
+        if rows:
+            self.cursor.executemany(f"INSERT INTO {table} VALUES ({', '.join(['?'] * len(rows[0]))})", rows)
+
+    def executemany(self, sql, rows):
+        self.cursor.executemany(translate(sql), rows)
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+
+class SQLiteConnection:
+    """Connexion SQLite avec l'interface MySQLdb utilisée par le chargeur."""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        # Verrous nommés MySQL: une seule connexion écrit à la fois dans le banc d'essai
+        self.conn.create_function('GET_LOCK', 2, lambda name, timeout: 1)
+        self.conn.create_function('RELEASE_LOCK', 1, lambda name: 1)
+
+    def cursor(self):
+        return SQLiteCursor(self.conn)
+
+    def autocommit(self, enabled):
+        pass  # sqlite3 ouvre implicitement une transaction à la première écriture
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        self.conn.close()
+
+
+class SQLiteHook:
+    """Remplaçant local de MySqlHook: une base SQLite par scénario."""
+
+    def __init__(self, path):
+        self.path = path
+        conn = sqlite3.connect(path)
+        conn.executescript(SQLITE_SCHEMA)
+        conn.close()
+
+    def get_conn(self):
+        return SQLiteConnection(self.path)
+
+
+def synthetic_records(count, authors_per_record=3, journals=500, authors=20000, row_fraction=0.5,
+                      invalid_fraction=0.0, seed=0):
+    """Générer `count` enregistrements bruts, mélange des deux structures d'entrée.
+
+    Une fraction `row_fraction` sont des lignes Postgres (tuples), le reste des
+    documents Mongo; une fraction `invalid_fraction` a une date invalide et
+    part en quarantaine.
+    """
+    rng = random.Random(seed)
+    start = date(2000, 1, 1)
+    for index in range(count):
+        title = f'Synthetic publication {index}'
+        doi = f'10.5555/synthetic.{index}'
+        names = [f'Author {rng.randrange(authors)}' for _ in range(authors_per_record)]
+        journal = f'Journal {rng.randrange(journals)}'
+        day = start + timedelta(days=rng.randrange(9000))
+        published = f'{day.day} {MONTHS[day.month - 1]} {day.year}'
+        if rng.random() < invalid_fraction:
+            published = 'not a date'
+        abstract = 'Lorem ipsum dolor sit amet. ' * rng.randint(2, 12)
+
+        if rng.random() < row_fraction:
+            # Le titre sert aussi de nom de journal pour les lignes (voir convert_structure)
+            yield (index, journal, doi, ', '.join(names), f'Date of Publication: {published}',
+                   f'{rng.randrange(10000):04d}-{rng.randrange(10000):04d}', f'https://example.org/{index}',
+                   None, abstract)
+        else:
+            yield {
+                'Title': title,
+                'DOI': doi,
+                'Authors': names,
+                'Publication Date': published,
+                'ISSN': {'Electronic ISSN': f'{rng.randrange(10000):04d}-{rng.randrange(10000):04d}'},
+                'Link': f'https://example.org/{index}',
+                'Quartils': [{'année': str(year), 'quartil': rng.choice(['Q1', 'Q2', str(rng.uniform(0, 6))])}
+                             for year in range(2019, 2019 + rng.randint(0, 4))],
+                'journal_main': f'Published in: {journal} (Volume {rng.randint(1, 60)})',
+                'abstract': abstract,
+            }
+
+
+def generate(config):
+    return synthetic_records(config['records'], config['authors_per_record'], config['journals'], config['authors'],
+                             config['row_fraction'], config['invalid_fraction'], config['seed'])
+
+
+def check_backfill(count=2000, seed=0):
+    """Lister les écarts des fusions de BackfillLoader avec le filtre des publications inchangées.
+
+    Les publications sont d'abord chargées par WarehouseLoader, puis leur
+    ContentHash est effacé, comme pour des publications chargées avant son
+    ajout: un backfill doit toutes les réécrire, avec leurs quartils, et le
+    backfill suivant ne doit plus en réécrire aucune.
+    """
+    logging.basicConfig(level=logging.ERROR)
+    tmp_dir = tempfile.mkdtemp(prefix='warehouse_backfill_check_')
+    path = os.path.join(tmp_dir, 'warehouse.db')
+    hook = SQLiteHook(path)
+    records = list(synthetic_records(count, seed=seed))
+    mismatches = []
+
+    def update(*statements):
+        conn = sqlite3.connect(path)
+        with conn:
+            for statement in statements:
+                conn.execute(statement)
+        conn.close()
+
+    def counts():
+        """Publications, avec ContentHash, au titre "stale"; quartils, au quartil "stale"."""
+        conn = sqlite3.connect(path)
+        try:
+            return (conn.execute("SELECT COUNT(*), COUNT(ContentHash), TOTAL(Title = 'stale') FROM Publications")
+                    .fetchone() + conn.execute("SELECT COUNT(*), TOTAL(quartil = 'stale') FROM Quartils").fetchone())
+        finally:
+            conn.close()
+
+    try:
+        with WarehouseLoader(hook) as loader:
+            loader.load(records)
+        publications, _, _, quartils, _ = counts()
+
+        # Publications chargées avant ContentHash: toutes réécrites, avec leurs quartils
+        update("UPDATE Publications SET ContentHash = NULL, Title = 'stale'", "UPDATE Quartils SET quartil = 'stale'")
+        with BackfillLoader(hook, tmp_dir=tmp_dir) as backfill:
+            backfill.load(records)
+        total, hashed, stale, total_quartils, stale_quartils = counts()
+        if (total, total_quartils) != (publications, quartils):
+            mismatches.append(f"backfill changed the row counts: {total} publications and {total_quartils} "
+                              f"quartils, expected {publications} and {quartils}")
+        if hashed != total or stale:
+            mismatches.append(f"{total - hashed} publications without ContentHash and {stale:.0f} not rewritten "
+                              f"by the backfill")
+        if stale_quartils:
+            mismatches.append(f"{stale_quartils:.0f} quartils not rewritten by the backfill")
+
+        # Publications inchangées: ni elles ni leurs quartils ne sont réécrits
+        update("UPDATE Publications SET Title = 'stale'", "UPDATE Quartils SET quartil = 'stale'")
+        with BackfillLoader(hook, tmp_dir=tmp_dir) as backfill:
+            backfill.load(records)
+        total, _, stale, total_quartils, stale_quartils = counts()
+        if stale != total or stale_quartils != total_quartils:
+            mismatches.append(f"{total - stale:.0f} unchanged publications and {total_quartils - stale_quartils:.0f} "
+                              f"of their quartils rewritten by a second backfill")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return mismatches
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss est en kilo-octets sous Linux, en octets sous macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(who).ru_maxrss * scale / 2 ** 20
+
+
+def run_scenario(config):
+    """Exécuter un scénario (dans son propre processus) et retourner ses mesures."""
+    # Les rejets sont journalisés un par un: seules les erreurs sont affichées
+    logging.basicConfig(level=logging.ERROR)
+    tmp_dir = tempfile.mkdtemp(prefix='warehouse_benchmark_')
+    hook = SQLiteHook(os.path.join(tmp_dir, 'warehouse.db'))
+    metrics = PipelineMetrics(run_id='benchmark', task_id='benchmark', source='synthetic')
+    started = time.perf_counter()
+
+    totals = dict.fromkeys(('publications_loaded', 'publications_unchanged', 'publications_rejected'), 0)
+    manifest = None
+    if config['staging']:
+        with metrics.stage('stage_write') as stage:
+            manifest = write_chunks(chunked(generate(config), config['chunk_size']), os.path.join(tmp_dir, 'staging'))
+            stage.count(rows_in=manifest['rows'], rows_out=manifest['rows'],
+                        bytes=sum(file['bytes'] for file in manifest['files']))
+
+    # Avec --reload, les mêmes données sont rechargées: mesure le chemin des publications inchangées
+    for attempt in range(1 + config['reload']):
+        chunks = read_chunks(manifest) if manifest else chunked(generate(config), config['chunk_size'])
+        chunks = metrics.timed('read', chunks)
+        if config['transform_workers'] > 1:
+            results = transform_parallel(chunks, config['transform_workers'])
+        else:
+            results = ((chunk, transform_chunk(chunk)) for chunk in chunks)
+
+        loader = WarehouseLoader(hook, batch_size=config['batch_size'], commit_every=config['commit_every'],
+                                 source='synthetic', run_id='benchmark', checkpoint_key='benchmark',
+                                 metrics=metrics)
+        with loader:
+            while True:
+                with metrics.stage('normalize') as stage:
+                    result = next(results, None)
+                    if result is not None:
+                        chunk, transformed = result
+                        stage.count(rows_in=len(chunk),
+                                    rows_out=sum(1 for _, record, _ in transformed if record is not None))
+                if result is None:
+                    break
+                loader.load_transformed(transformed, chunk)
+        for name in totals:
+            totals[name] += getattr(loader, name)
+
+    elapsed = time.perf_counter() - started
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return {
+        'config': config,
+        'seconds': elapsed,
+        'rows_per_second': config['records'] * (1 + config['reload']) / elapsed if elapsed else None,
+        **totals,
+        'round_trips': sum(stage.round_trips for stage in metrics.stages.values()),
+        'peak_rss_mb': peak_rss_mb(),
+        'peak_rss_children_mb': peak_rss_mb(resource.RUSAGE_CHILDREN),
+        'stages': {
+            stage.name: {
+                'seconds': stage.seconds, 'rows_in': stage.rows_in, 'rows_out': stage.rows_out,
+                'bytes': stage.bytes, 'round_trips': stage.round_trips, 'rows_per_second': stage.rows_per_second,
+            }
+            for stage in metrics.stages.values()
+        },
+    }
+
+
+def scenario_name(config):
+    return (f"workers={config['transform_workers']}/batch={config['batch_size']}"
+            f"/commit_every={config['commit_every']}{'/staging' if config['staging'] else ''}")
+
+
+def print_result(result):
+    print(f"\n{scenario_name(result['config'])}: {result['rows_per_second']:.0f} rows/s, "
+          f"{result['seconds']:.2f}s, peak RSS {result['peak_rss_mb']:.0f} MB "
+          f"(workers {result['peak_rss_children_mb']:.0f} MB), {result['round_trips']} round trips")
+    print(f"  {result['publications_loaded']} loaded, {result['publications_unchanged']} unchanged, "
+          f"{result['publications_rejected']} quarantined")
+    print(f"  {'stage':<12}{'seconds':>10}{'rows in':>10}{'rows out':>10}{'rows/s':>12}{'round trips':>13}")
+    for name, stage in result['stages'].items():
+        rate = f"{stage['rows_per_second']:.0f}" if stage['rows_per_second'] else '-'
+        print(f"  {name:<12}{stage['seconds']:>10.3f}{stage['rows_in']:>10}{stage['rows_out']:>10}{rate:>12}"
+              f"{stage['round_trips']:>13}")
+
+
+def compare(results, baseline, tolerance):
+    """Lister les régressions par rapport aux résultats de référence."""
+    previous = {scenario_name(result['config']): result for result in baseline}
+    regressions = []
+    for result in results:
+        reference = previous.get(scenario_name(result['config']))
+        if reference is None:
+            continue
+        name = scenario_name(result['config'])
+        if result['rows_per_second'] < reference['rows_per_second'] * (1 - tolerance):
+            regressions.append(f"{name}: {result['rows_per_second']:.0f} rows/s, "
+                               f"baseline {reference['rows_per_second']:.0f} rows/s")
+        if result['round_trips'] > reference['round_trips'] * (1 + tolerance):
+            regressions.append(f"{name}: {result['round_trips']} round trips, baseline {reference['round_trips']}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline warehouse loader benchmark (SQLite stand-in).")
+    parser.add_argument('--records', type=int, default=50000)
+    parser.add_argument('--authors-per-record', type=int, default=3)
+    parser.add_argument('--journals', type=int, default=500, help="Journal cardinality")
+    parser.add_argument('--authors', type=int, default=20000, help="Author cardinality")
+    parser.add_argument('--row-fraction', type=float, default=0.5,
+                        help="Fraction of Postgres-style rows, the rest are Mongo documents")
+    parser.add_argument('--invalid-fraction', type=float, default=0.0, help="Fraction of records to quarantine")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--batch-size', type=int, nargs='+', default=[1000])
+    parser.add_argument('--commit-every', type=int, nargs='+', default=[1])
+    parser.add_argument('--transform-workers', type=int, nargs='+', default=[1])
+    parser.add_argument('--staging', action='store_true', help="Go through staged NDJSON files")
+    parser.add_argument('--reload', type=int, default=0, help="Reload the same data N more times")
+    parser.add_argument('--json', help="Write the results to this file")
+    parser.add_argument('--baseline', help="Compare with the results of a previous --json run")
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--check-backfill', action='store_true',
+                        help="Check that the backfill merges rewrite only new or changed publications first")
+    args = parser.parse_args(argv)
+
+    if args.check_backfill:
+        mismatches = check_backfill(seed=args.seed)
+        for mismatch in mismatches:
+            print(f"MISMATCH {mismatch}")
+        if mismatches:
+            return 1
+        print("Backfill merges rewrite new and changed publications only.")
+        if not args.records:
+            return 0
+
+    base = {
+        'records': args.records, 'authors_per_record': args.authors_per_record, 'journals': args.journals,
+        'authors': args.authors, 'row_fraction': args.row_fraction, 'invalid_fraction': args.invalid_fraction,
+        'seed': args.seed, 'chunk_size': args.chunk_size, 'staging': args.staging, 'reload': args.reload,
+    }
+    results = []
+    for workers, batch_size, commit_every in itertools.product(
+            args.transform_workers, args.batch_size, args.commit_every):
+        config = dict(base, transform_workers=workers, batch_size=batch_size,
+                      commit_every=commit_every)
+        # Processus neuf par scénario: le pic de mémoire (ru_maxrss) ne se cumule pas
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            result = executor.submit(run_scenario, config).result()
+        print_result(result)
+        results.append(result)
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
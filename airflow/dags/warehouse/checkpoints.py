@@ -0,0 +1,37 @@
+import logging
+
+
+# Progression des tâches de chargement: nombre d'enregistrements d'entrée
+# traités, mis à jour dans la même transaction que chaque lot validé
+CREATE_CHECKPOINTS_SQL = """
+    CREATE TABLE IF NOT EXISTS LoadCheckpoints (
+        CheckpointKey VARCHAR(255) NOT NULL PRIMARY KEY,
+        RecordsDone BIGINT NOT NULL,
+        UpdatedAt TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    )
+"""
+
+SAVE_CHECKPOINT_SQL = (
+    "INSERT INTO LoadCheckpoints (CheckpointKey, RecordsDone) VALUES (%s, %s) "
+    "ON DUPLICATE KEY UPDATE RecordsDone = VALUES(RecordsDone)"
+)
+
+
+def checkpoint_key(ti):
+    """Clé stable d'une tâche (éventuellement dupliquée par .expand) d'une exécution du DAG."""
+    return f'{ti.dag_id}/{ti.run_id}/{ti.task_id}/{ti.map_index}'
+
+
+def load_checkpoint(cursor, key):
+    """Nombre d'enregistrements déjà validés par une tentative précédente de la tâche."""
+    cursor.execute(CREATE_CHECKPOINTS_SQL)
+    cursor.execute("SELECT RecordsDone FROM LoadCheckpoints WHERE CheckpointKey = %s", (key,))
+    row = cursor.fetchone()
+    if row:
+        logging.info(f"Resuming '{key}' after {row[0]} committed records.")
+        return row[0]
+    return 0
+
+
+def save_checkpoint(cursor, key, records_done):
+    cursor.execute(SAVE_CHECKPOINT_SQL, (key, records_done))
@@ -0,0 +1,93 @@
+import logging
+
+
+# Taille maximale des clauses IN utilisées pour relire les IDs insérés
+LOOKUP_CHUNK_SIZE = 1000
+
+
+class DimensionCache:
+    """Cache mémoire nom -> ID d'une table de dimension (Authors, Journal).
+
+    Le cache est préchargé une seule fois depuis MySQL au début du chargement.
+    Seuls les noms inconnus sont insérés en masse, puis leurs IDs sont relus et
+    ajoutés au cache sous le nom recherché. Les IDs insérés dans une transaction
+    annulée sont oubliés via ``rollback()``.
+    """
+
+    def __init__(self, table, key_column, id_column, insert_sql):
+        self.table = table
+        self.key_column = key_column
+        self.id_column = id_column
+        self.insert_sql = insert_sql
+        self.ids = {}
+        self.hits = 0
+        self.misses = 0
+        self._uncommitted = []
+
+    def prewarm(self, cursor):
+        """Charger toute la correspondance nom -> ID existante."""
+        cursor.execute(f"SELECT {self.key_column}, {self.id_column} FROM {self.table}")
+        self.ids = dict(cursor.fetchall())
+        logging.info(f"{self.table} cache prewarmed with {len(self.ids)} entries.")
+
+    def resolve(self, cursor, entries):
+        """Résoudre des paires (nom, paramètres d'insertion) et retourner {nom: ID}.
+
+        Chaque occurrence compte comme une recherche; les noms inconnus sont
+        insérés avec les paramètres de leur première occurrence.
+        """
+        missing = {}
+        for name, insert_params in entries:
+            if name in self.ids or name in missing:
+                self.hits += 1
+            else:
+                self.misses += 1
+                missing.setdefault(name, insert_params)
+
+        if missing:
+            cursor.executemany(self.insert_sql, list(missing.values()))
+            self._fetch_ids(cursor, list(missing))
+            self._uncommitted.extend(missing)
+
+        return self.ids
+
+    def _fetch_ids(self, cursor, names):
+        for start in range(0, len(names), LOOKUP_CHUNK_SIZE):
+            chunk = names[start:start + LOOKUP_CHUNK_SIZE]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(
+                f"SELECT {self.key_column}, {self.id_column} FROM {self.table} "
+                f"WHERE {self.key_column} IN ({placeholders})",
+                chunk
+            )
+            self.ids.update(cursor.fetchall())
+
+        # La relecture renvoie les noms tels que stockés: avec la collation de la
+        # colonne (insensible à la casse par défaut), INSERT IGNORE a pu ignorer un
+        # nom égal à une ligne existante écrite autrement. Ces noms sont relus un
+        # par un, comparés par MySQL comme dans la clé unique
+        for name in names:
+            if name not in self.ids:
+                cursor.execute(
+                    f"SELECT {self.id_column} FROM {self.table} WHERE {self.key_column} = %s LIMIT 1",
+                    (name,)
+                )
+                row = cursor.fetchone()
+                if row is not None:
+                    self.ids[name] = row[0]
+
+    def commit(self):
+        self._uncommitted = []
+
+    def rollback(self):
+        for name in self._uncommitted:
+            self.ids.pop(name, None)
+        self._uncommitted = []
+
+    def log_stats(self):
+        lookups = self.hits + self.misses
+        hit_ratio = self.hits / lookups if lookups else 0.0
+        logging.info(
+            f"{self.table} cache: {self.hits} hits, {self.misses} misses "
+            f"({hit_ratio:.1%} hit ratio), {len(self.ids)} entries."
+        )
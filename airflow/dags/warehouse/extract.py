@@ -0,0 +1,172 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_MONGO_CURSOR_BATCH_SIZE = 1000
+
+POSTGRES_JOURNALS_TABLE = 'journals'
+
+# Colonnes lues dans la table Postgres, dans l'ordre attendu par
+# loader.verify_and_convert_structure (item[1] = titre, item[2] = DOI, ...)
+POSTGRES_JOURNALS_COLUMNS = (
+    'id',
+    'title',
+    'doi',
+    'authors',
+    'publication_date',
+    'issn',
+    'link',
+    'quartils',
+    'abstract',
+)
+
+# Champs des documents Mongo lus par le chargeur (voir loader.normalize_record)
+MONGO_PROJECTION = {
+    '_id': 1,
+    'Title': 1,
+    'DOI': 1,
+    'Authors': 1,
+    'Publication Date': 1,
+    'ISSN': 1,
+    'Link': 1,
+    'Quartils': 1,
+    'journal_main': 1,
+    'abstract': 1,
+}
+
+
+# Les watermarks transitent par XCom et sont stockés dans des Variables Airflow:
+# ObjectId, datetime, date (colonne DATE) et Decimal (colonne NUMERIC) sont encodés
+# en JSON étendu.
+def encode_watermark(value):
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+    if isinstance(value, Decimal):
+        return {'$numberDecimal': str(value)}
+    if isinstance(value, datetime):
+        return {'$date': value.isoformat()}
+    if isinstance(value, date):
+        return {'$dateOnly': value.isoformat()}
+    from bson import ObjectId
+    if isinstance(value, ObjectId):
+        return {'$oid': str(value)}
+    raise TypeError(f"Unsupported watermark type: {type(value).__name__}")
+
+
+def decode_watermark(value):
+    if isinstance(value, dict) and '$numberDecimal' in value:
+        return Decimal(value['$numberDecimal'])
+    if isinstance(value, dict) and '$date' in value:
+        return datetime.fromisoformat(value['$date'])
+    if isinstance(value, dict) and '$dateOnly' in value:
+        return date.fromisoformat(value['$dateOnly'])
+    if isinstance(value, dict) and '$oid' in value:
+        from bson import ObjectId
+        return ObjectId(value['$oid'])
+    return value
+
+
+def make_window(field, low, high):
+    """Fenêtre d'extraction ]low, high] sur `field` (valeurs encodées)."""
+    return {'field': field, 'low': low, 'high': encode_watermark(high)}
+
+
+def chunked(rows, chunk_size):
+    """Regrouper un itérable en listes d'au plus `chunk_size` éléments."""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_mongo_documents(collection, query=None, cursor_batch_size=DEFAULT_MONGO_CURSOR_BATCH_SIZE):
+    """Parcourir la collection en flux avec la projection utilisée par le chargeur."""
+    # Ordre stable par _id: une nouvelle tentative relit les documents dans le même ordre (voir checkpoints)
+    cursor = collection.find(query or {}, projection=MONGO_PROJECTION, sort=[('_id', 1)],
+                             batch_size=cursor_batch_size)
+    try:
+        for document in cursor:
+            document['_id'] = str(document['_id'])  # Convert ObjectId to string
+            yield document
+    finally:
+        cursor.close()
+
+
+def mongo_high_watermark(collection, field):
+    """Valeur maximale actuelle de `field` dans la collection, ou None si elle est vide."""
+    document = collection.find_one({field: {'$exists': True}}, projection={field: 1}, sort=[(field, -1)])
+    return document[field] if document else None
+
+
+def mongo_window_query(window):
+    """Filtre Mongo correspondant à une fenêtre d'extraction."""
+    if window is None:
+        return {}
+    bounds = {'$lte': decode_watermark(window['high'])}
+    if window['low'] is not None:
+        bounds['$gt'] = decode_watermark(window['low'])
+    return {window['field']: bounds}
+
+
+def iter_mongo_chunks(collection, chunk_size=DEFAULT_CHUNK_SIZE, cursor_batch_size=DEFAULT_MONGO_CURSOR_BATCH_SIZE,
+                      query=None):
+    """Lire la collection par morceaux de `chunk_size` documents, en mémoire bornée."""
+    return chunked(iter_mongo_documents(collection, query, cursor_batch_size), chunk_size)
+
+
+def postgres_high_watermark(connection, field, table=POSTGRES_JOURNALS_TABLE):
+    """Valeur maximale actuelle de `field` dans la table, ou None si elle est vide."""
+    from psycopg2 import sql
+
+    # `field` vient d'un paramètre du DAG: noms cités, jamais interpolés tels quels
+    with connection.cursor() as cursor:
+        cursor.execute(sql.SQL("SELECT max({}) FROM {}").format(sql.Identifier(field), sql.Identifier(table)))
+        return cursor.fetchone()[0]
+
+
+def postgres_window_clause(window):
+    """Clause WHERE (psycopg2.sql) et paramètres correspondant à une fenêtre d'extraction."""
+    from psycopg2 import sql
+
+    if window is None:
+        return sql.SQL('TRUE'), {}
+    field = sql.Identifier(window['field'])
+    clause = sql.SQL("{} <= %(high)s").format(field)
+    params = {'high': decode_watermark(window['high'])}
+    if window['low'] is not None:
+        clause = sql.SQL("{} > %(low)s AND {}").format(field, clause)
+        params['low'] = decode_watermark(window['low'])
+    return clause, params
+
+
+def iter_postgres_chunks(connection, chunk_size=DEFAULT_CHUNK_SIZE, window=None, table=POSTGRES_JOURNALS_TABLE,
+                         columns=POSTGRES_JOURNALS_COLUMNS):
+    """Lire la table avec un curseur nommé (côté serveur), `chunk_size` lignes à la fois.
+
+    Seules `chunk_size` lignes sont présentes en mémoire côté worker. Avec une
+    fenêtre, seules les lignes de ]low, high] sont lues.
+    """
+    from psycopg2 import sql
+
+    where, params = postgres_window_clause(window)
+    query = sql.SQL("SELECT {} FROM {} WHERE {} ORDER BY {}").format(
+        sql.SQL(', ').join(map(sql.Identifier, columns)), sql.Identifier(table), where, sql.Identifier(columns[0])
+    )
+
+    # Un curseur nommé garde le résultat côté serveur au lieu de tout envoyer au client
+    cursor = connection.cursor(name=f'{table}_stream')
+    cursor.itersize = chunk_size
+    try:
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
@@ -0,0 +1,126 @@
+import csv
+import glob
+import gzip
+import json
+import logging
+import os
+
+from warehouse.extract import chunked
+
+
+# Répertoire des exports de fichiers (volume data_set du docker-compose)
+DEFAULT_DATA_DIR = os.environ.get('PIPELINE_DATA_DIR', '/opt/airflow/data_set')
+
+DEFAULT_JSON_PATTERN = os.path.join(DEFAULT_DATA_DIR, 'journals*.json*')
+DEFAULT_CSV_PATTERN = os.path.join(DEFAULT_DATA_DIR, 'journals*.csv*')
+
+# Taille des blocs lus à la fois par le parseur JSON incrémental
+JSON_BLOCK_SIZE = 1 << 16
+
+_json_decoder = json.JSONDecoder()
+
+
+def expand_paths(pattern):
+    """Fichiers correspondant au motif glob (``**`` récursif), triés pour un ordre de lecture stable."""
+    return sorted(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+
+
+def files_high_watermark(paths):
+    """Date de modification la plus récente des fichiers, ou None s'il n'y en a aucun."""
+    return max((os.path.getmtime(path) for path in paths), default=None)
+
+
+def modified_in(paths, window):
+    """Fichiers modifiés dans la fenêtre d'extraction ]low, high] (sur mtime)."""
+    return [
+        path for path in paths
+        if (window['low'] is None or os.path.getmtime(path) > window['low'])
+        and os.path.getmtime(path) <= window['high']
+    ]
+
+
+def open_text(path):
+    """Ouvrir un fichier texte UTF-8, décompressé à la volée s'il est gzippé."""
+    with open(path, 'rb') as file:
+        compressed = file.read(2) == b'\x1f\x8b'
+    if compressed:
+        return gzip.open(path, 'rt', encoding='utf-8-sig', newline='')
+    return open(path, 'r', encoding='utf-8-sig', newline='')
+
+
+def iter_json_records(path, block_size=JSON_BLOCK_SIZE):
+    """Lire un fichier JSON enregistrement par enregistrement, en mémoire bornée.
+
+    Un tableau JSON produit chacun de ses éléments; sinon le fichier est lu
+    comme une suite de valeurs (NDJSON, ou un seul document).
+    """
+    with open_text(path) as file:
+        buffer = file.read(block_size)
+        position = 0
+        eof = not buffer
+        in_array = None
+
+        def fill():
+            """Ajouter un bloc au tampon; False en fin de fichier."""
+            nonlocal buffer, position, eof
+            block = file.read(block_size)
+            if not block:
+                eof = True
+                return False
+            buffer = buffer[position:] + block
+            position = 0
+            return True
+
+        while True:
+            # Sauter les blancs et, dans un tableau, les virgules entre les éléments
+            while position < len(buffer) and (buffer[position].isspace() or (in_array and buffer[position] == ',')):
+                position += 1
+            if position >= len(buffer):
+                if eof or not fill():
+                    break
+                continue
+
+            if in_array is None:
+                in_array = buffer[position] == '['
+                if in_array:
+                    position += 1
+                continue
+            if in_array and buffer[position] == ']':
+                break
+
+            try:
+                record, end = _json_decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # Élément incomplet: lire la suite du fichier, erreur réelle en fin de fichier
+                if eof or not fill():
+                    raise
+                continue
+
+            # Un nombre peut être coupé en fin de bloc: le relire avec la suite
+            if end == len(buffer) and not eof and not isinstance(record, (dict, list, str)):
+                if fill():
+                    continue
+
+            position = end
+            yield record
+
+            # Libérer la partie déjà décodée du tampon
+            if position > block_size:
+                buffer = buffer[position:]
+                position = 0
+
+
+def iter_csv_records(path):
+    """Lire un fichier CSV ligne par ligne (dictionnaires indexés par l'en-tête)."""
+    with open_text(path) as file:
+        yield from csv.DictReader(file)
+
+
+def iter_file_chunks(paths, parse, chunk_size):
+    """Morceaux d'au plus `chunk_size` enregistrements lus en flux dans les fichiers, l'un après l'autre."""
+    def records():
+        for path in paths:
+            logging.info(f"Reading {path}.")
+            yield from parse(path)
+
+    return chunked(records(), chunk_size)
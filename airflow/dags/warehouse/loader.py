@@ -0,0 +1,617 @@
+import hashlib
+import json
+import logging
+import re
+from contextlib import contextmanager
+from datetime import datetime
+
+from warehouse.checkpoints import load_checkpoint, save_checkpoint
+from warehouse.dimensions import DimensionCache
+from warehouse.metrics import PipelineMetrics
+from warehouse.quarantine import ensure_quarantine, write_quarantine
+
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_COMMIT_EVERY = 1
+
+# Nom du journal dans "Published in: <nom> (...)"
+JOURNAL_NAME_PATTERN = r"Published in:\s*([^(\n]+)"
+
+# Les publications sont identifiées par PublicationKey (DOI, ou titre + journal à
+# défaut) et portent l'empreinte de leur contenu: les réexécutions ne réécrivent
+# que les publications nouvelles ou modifiées
+UPSERT_PUBLICATION_SQL = """
+    INSERT INTO Publications (Title, DOI, PublicationDate, Link, Abstract, JournalID, Quartils,
+                              PublicationKey, ContentHash)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        Title = VALUES(Title), DOI = VALUES(DOI), PublicationDate = VALUES(PublicationDate),
+        Link = VALUES(Link), Abstract = VALUES(Abstract), JournalID = VALUES(JournalID),
+        Quartils = VALUES(Quartils), ContentHash = VALUES(ContentHash)
+"""
+
+PUBLICATION_KEY_COLUMNS_SQL = {
+    'PublicationKey': "ALTER TABLE Publications ADD COLUMN PublicationKey CHAR(64) NULL",
+    'ContentHash': "ALTER TABLE Publications ADD COLUMN ContentHash CHAR(64) NULL",
+}
+
+# Ajoutée une fois PublicationKey calculée pour les publications déjà chargées
+PUBLICATION_KEY_INDEX_SQL = "ALTER TABLE Publications ADD UNIQUE KEY uq_publications_key (PublicationKey)"
+
+# Verrou MySQL nommé: une seule des tâches de chargement parallèles migre le schéma
+SCHEMA_LOCK = 'warehouse_schema'
+SCHEMA_LOCK_TIMEOUT = 3600
+
+# Publications lues par requête pour calculer leur PublicationKey
+FILL_PAGE_SIZE = 1000
+
+# Clés uniques des noms de dimensions, ajoutées au premier chargement: sans elles,
+# les tâches de chargement parallèles inséreraient chacune le même nom
+DIMENSION_KEYS_SQL = {
+    ('Authors', 'AuthorName'): "ALTER TABLE Authors ADD UNIQUE KEY uq_authors_name (AuthorName)",
+    ('Journal', 'JournalMain'): "ALTER TABLE Journal ADD UNIQUE KEY uq_journal_main (JournalMain)",
+}
+
+# INSERT IGNORE: plusieurs tâches de chargement parallèles peuvent insérer le même
+# nom, la clé unique n'en garde qu'un; les IDs sont de toute façon relus après
+# insertion (voir DimensionCache)
+INSERT_AUTHOR_SQL = """
+    INSERT IGNORE INTO Authors (AuthorName, Affiliation, Country)
+    VALUES (%s, NULL, NULL)
+"""
+
+INSERT_JOURNAL_SQL = "INSERT IGNORE INTO Journal (JournalMain, ISSN, Quartils) VALUES (%s, %s, %s)"
+
+INSERT_QUARTIL_SQL = (
+    "INSERT INTO Quartils (annee, quartil, id_journal) VALUES (%s, %s, %s) "
+    "ON DUPLICATE KEY UPDATE quartil = VALUES(quartil)"
+)
+
+
+def convert_structure(item):
+    """Mettre un enregistrement brut dans la première structure (document Mongo)."""
+    # Si la structure correspond à la première, nous n'avons rien à faire.
+    if isinstance(item, dict) and "Title" in item and "DOI" in item and "Authors" in item:
+        return item
+
+    # Sinon, nous convertissons la structure vers la première structure attendue
+    try:
+        return {
+            "Title": item[1],
+            "DOI": item[2],
+            "Authors": item[3].split(', '),  # Séparer les auteurs en liste
+            "Publication Date": item[4].replace('Date of Publication: ', ''),
+            "ISSN": item[5],
+            "Link": item[6],
+            "Quartils": item[7] if isinstance(item[7], str) else "Journal pas indexé Scopus",
+            # Si Quartils est une chaîne, on le garde, sinon on assigne une valeur par défaut
+            "journal_main": f"Published in: {item[1]}",
+            "abstract": item[8] if len(item) > 8 else None  # Si l'index 8 existe, on l'assigne, sinon None
+        }
+    except (KeyError, IndexError, TypeError, AttributeError) as e:
+        # Les sources de fichiers peuvent contenir des enregistrements d'une autre forme
+        raise ValueError(f"Unsupported record structure: {e!r}") from e
+
+
+def verify_and_convert_structure(t):
+    result = []
+
+    for item in t:
+        try:
+            result.append(convert_structure(item))
+        except ValueError as e:
+            logging.error(f"{e}, skipped.")
+
+    return result
+
+
+def determine_quartile_from_citescore(citescore):
+    """Déterminer le quartil basé sur le CiteScore."""
+    if citescore >= 4.0:
+        return "Q1"
+    elif citescore >= 2.0:
+        return "Q2"
+    elif citescore >= 1.0:
+        return "Q3"
+    else:
+        return "Q4"
+
+
+def process_quartil(quartil_value):
+    """Vérifier si le quartil est un nombre et le transformer en quartil valide."""
+    try:
+        # Si le quartil est un nombre, déterminer le quartil approprié
+        quartil_float = float(quartil_value)
+
+        # Retourner le quartil basé sur la valeur numérique
+        return determine_quartile_from_citescore(quartil_float)
+    except (TypeError, ValueError):
+        # Si ce n'est pas un nombre, il doit être déjà sous forme de quartil (par exemple "Q1", "Q2", ...)
+        return quartil_value  # Retourner le quartil tel quel s'il est valide (Q1, Q2, etc.)
+
+
+def extract_journal_name(journal_main):
+    # Regular expression to capture the journal name
+    match = re.search(JOURNAL_NAME_PATTERN, journal_main)
+    if match:
+        journal_name = match.group(1).strip()  # Capture the matched group and strip any surrounding whitespace
+        return journal_name
+    return None  # Return None if no match is found
+
+
+def extract_electronic_issn(issn):
+    """Extraire l'ISSN électronique d'une entrée."""
+    if isinstance(issn, dict):
+        return issn.get('Electronic ISSN', 'Non disponible')
+    elif isinstance(issn, str):
+        return issn
+    return 'Non disponible'
+
+
+def normalize_record(entry):
+    """Mettre une publication au format attendu par le chargeur."""
+    quartils = entry.get('Quartils', [])
+    publication_date_str = entry.get('Publication Date', '').replace("Date of Publication: ", "")
+
+    # Les sources de fichiers (CSV, JSON) donnent les auteurs en une chaîne, comme les lignes Postgres
+    authors = entry.get('Authors', [])
+    if isinstance(authors, str):
+        authors = authors.split(', ') if authors else []
+
+    # Une liste de quartils signifie que le journal est indexé Scopus
+    if isinstance(quartils, list):
+        last_quartil = quartils[-1].get('quartil', 'Non disponible') if quartils else 'Non disponible'
+        quartil_rows = [(q.get('année'), process_quartil(q.get('quartil'))) for q in quartils]
+    else:
+        last_quartil = 'Non disponible'
+        quartil_rows = []
+
+    return {
+        'title': entry.get('Title', ''),
+        'doi': entry.get('DOI', ''),
+        'authors': authors,
+        'publication_date': datetime.strptime(publication_date_str,
+                                              "%d %B %Y").date() if publication_date_str else None,
+        'link': entry.get('Link', ''),
+        'abstract': entry.get('abstract', ''),
+        'journal_main': extract_journal_name(entry.get('journal_main', '')),
+        'issn': extract_electronic_issn(entry.get('ISSN', {})),
+        'indexed': isinstance(quartils, list),
+        'quartils': quartil_rows,
+        'last_quartil': last_quartil,
+    }
+
+
+def normalize_entries(entries):
+    """Normaliser des enregistrements bruts un par un.
+
+    Produit (position, enregistrement brut, publication normalisée, raison du
+    rejet); la publication vaut None si l'enregistrement est rejeté.
+    """
+    for position, entry in enumerate(entries):
+        try:
+            record = normalize_record(convert_structure(entry))
+        except Exception as e:
+            yield position, entry, None, f"{type(e).__name__}: {e}"
+            continue
+        yield position, entry, record, None
+
+
+def publication_key(record):
+    """Clé d'idempotence d'une publication: DOI normalisé, ou titre + journal à défaut."""
+    doi = (record['doi'] or '').strip().lower()
+    doi = re.sub(r'^(https?://)?(dx\.)?doi\.org/', '', doi)
+    if doi:
+        key = f'doi:{doi}'
+    else:
+        title = ' '.join((record['title'] or '').lower().split())
+        journal = ' '.join((record['journal_main'] or '').lower().split())
+        key = f'title:{title}|{journal}'
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def content_hash(record):
+    """Empreinte du contenu chargé d'une publication normalisée."""
+    content = {name: record[name] for name in (
+        'title', 'doi', 'authors', 'publication_date', 'link', 'abstract',
+        'journal_main', 'issn', 'indexed', 'quartils', 'last_quartil',
+    )}
+    payload = json.dumps(content, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+@contextmanager
+def schema_lock(cursor):
+    """Sérialiser les migrations de schéma des tâches de chargement parallèles."""
+    cursor.execute("SELECT GET_LOCK(%s, %s)", (SCHEMA_LOCK, SCHEMA_LOCK_TIMEOUT))
+    if not cursor.fetchone()[0]:
+        raise RuntimeError(f"Could not acquire the '{SCHEMA_LOCK}' lock within {SCHEMA_LOCK_TIMEOUT}s.")
+    try:
+        yield
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (SCHEMA_LOCK,))
+        cursor.fetchall()
+
+
+def fill_publication_keys(cursor):
+    """Calculer PublicationKey des publications chargées avant son ajout.
+
+    Les clés sont calculées par publication_key, comme au chargement, à partir
+    du DOI, du titre et du nom du journal. Si plusieurs publications ont la
+    même clé (doublons des chargements précédents), seule la plus récente la
+    reçoit et sera mise à jour par les rechargements. ContentHash reste NULL:
+    chaque publication existante est réécrite une fois, en place.
+    """
+    seen = set()
+    filled = duplicates = 0
+    last_id = None
+    while True:
+        cursor.execute(
+            "SELECT p.PublicationID, p.DOI, p.Title, j.JournalMain, p.PublicationKey "
+            "FROM Publications p LEFT JOIN Journal j ON j.JournalID = p.JournalID "
+            f"{'WHERE p.PublicationID < %s ' if last_id is not None else ''}"
+            "ORDER BY p.PublicationID DESC LIMIT %s",
+            ([last_id] if last_id is not None else []) + [FILL_PAGE_SIZE]
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        updates = []
+        for publication_id, doi, title, journal_main, key in rows:
+            if key is None:
+                key = publication_key({'doi': doi, 'title': title, 'journal_main': journal_main})
+                if key in seen:
+                    duplicates += 1
+                    continue
+                updates.append((key, publication_id))
+            seen.add(key)
+        if updates:
+            cursor.executemany("UPDATE Publications SET PublicationKey = %s WHERE PublicationID = %s", updates)
+            filled += len(updates)
+        last_id = rows[-1][0]
+    logging.info(f"Filled PublicationKey of {filled} existing publications, "
+                 f"{duplicates} older duplicates left without key.")
+
+
+def ensure_publication_keys(cursor):
+    """Ajouter PublicationKey (unique) et ContentHash à Publications s'ils n'existent pas.
+
+    La clé unique n'est ajoutée qu'après le calcul de PublicationKey des
+    publications existantes, sans quoi le premier rechargement les dupliquerait.
+    """
+    with schema_lock(cursor):
+        cursor.execute(
+            "SELECT COLUMN_NAME FROM information_schema.COLUMNS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'Publications'"
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        for column, statement in PUBLICATION_KEY_COLUMNS_SQL.items():
+            if column not in existing:
+                cursor.execute(statement)
+                logging.info(f"Added column Publications.{column}.")
+
+        cursor.execute(
+            "SELECT COUNT(*) FROM information_schema.STATISTICS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'Publications' "
+            "AND INDEX_NAME = 'uq_publications_key'"
+        )
+        if not cursor.fetchone()[0]:
+            # Reprend aussi une migration interrompue: seules les clés NULL sont calculées
+            fill_publication_keys(cursor)
+            cursor.execute(PUBLICATION_KEY_INDEX_SQL)
+            logging.info("Added unique key on Publications.PublicationKey.")
+
+
+def ensure_dimension_keys(cursor):
+    """Ajouter les clés uniques de Authors.AuthorName et Journal.JournalMain si elles n'existent pas."""
+    with schema_lock(cursor):
+        cursor.execute(
+            "SELECT TABLE_NAME, COLUMN_NAME FROM information_schema.STATISTICS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND NON_UNIQUE = 0 AND SEQ_IN_INDEX = 1 "
+            "AND TABLE_NAME IN ('Authors', 'Journal')"
+        )
+        existing = {tuple(row) for row in cursor.fetchall()}
+        for (table, column), statement in DIMENSION_KEYS_SQL.items():
+            if (table, column) in existing:
+                continue
+            try:
+                cursor.execute(statement)
+                logging.info(f"Added unique key on {table}.{column}.")
+            except Exception as e:
+                # Doublons déjà présents, à fusionner avant de charger en parallèle
+                logging.error(f"Could not add unique key on {table}.{column}: {e}")
+
+
+class WarehouseLoader:
+    """Charge les publications dans l'entrepôt par lots.
+
+    Les publications sont accumulées jusqu'à ``batch_size`` entrées. Au moment
+    d'écrire un lot, les auteurs et journaux sont résolus via les caches de
+    dimensions, puis publications et quartils sont écrits avec un
+    ``executemany`` multi-lignes.
+
+    Le chargeur ouvre une seule connexion MySQL pour toute la tâche et valide
+    la transaction tous les ``commit_every`` lots. S'utilise comme gestionnaire
+    de contexte::
+
+        with WarehouseLoader(mysql_hook, batch_size=1000) as loader:
+            for chunk in loader.resume(chunks):
+                loader.load(chunk)
+
+    Les enregistrements rejetés (structure, date ou journal invalides, échec
+    d'écriture) sont mis en quarantaine dans LoadQuarantine avec la raison du
+    rejet. Avec ``checkpoint_key``, le nombre d'enregistrements d'entrée traités
+    est enregistré dans la même transaction que chaque validation: une nouvelle
+    tentative de la tâche reprend après le dernier lot validé.
+    """
+
+    def __init__(self, mysql_hook, batch_size=DEFAULT_BATCH_SIZE, commit_every=DEFAULT_COMMIT_EVERY,
+                 source='unknown', run_id=None, checkpoint_key=None, metrics=None):
+        self.mysql_hook = mysql_hook
+        self.batch_size = max(1, int(batch_size))
+        self.commit_every = max(1, int(commit_every))
+        self.source = source
+        self.run_id = run_id
+        self.checkpoint_key = checkpoint_key
+        self.metrics = metrics or PipelineMetrics(source=source)
+        self.conn = None
+        self.pending = []
+        self.uncommitted = []  # Lots écrits depuis la dernière validation
+        self.rejected = []  # (position, enregistrement brut, raison) pas encore en quarantaine
+        self.position = 0  # Position du prochain enregistrement d'entrée
+        self.done = 0  # Les enregistrements avant cette position sont écrits ou rejetés
+        self.resume_from = 0
+        self.batches = 0
+        self.transactions = 0
+        self.publications_loaded = 0
+        self.publications_unchanged = 0
+        self.publications_rejected = 0
+        self.quartils_loaded = 0
+        self.authors = DimensionCache('Authors', 'AuthorName', 'AuthorID', INSERT_AUTHOR_SQL)
+        self.journals = DimensionCache('Journal', 'JournalMain', 'JournalID', INSERT_JOURNAL_SQL)
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.finish()
+            elif self.conn is not None:
+                self._rollback()
+        finally:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    def open(self):
+        """Ouvrir la connexion de la tâche, lire le checkpoint et précharger les caches de dimensions."""
+        self.conn = self.metrics.instrument(self.mysql_hook.get_conn())
+        self.conn.autocommit(False)
+        with self.metrics.stage('prepare'), self.conn.cursor() as cursor:
+            ensure_publication_keys(cursor)
+            ensure_dimension_keys(cursor)
+            ensure_quarantine(cursor)
+            if self.checkpoint_key:
+                self.resume_from = self.done = load_checkpoint(cursor, self.checkpoint_key)
+            self.authors.prewarm(cursor)
+            self.journals.prewarm(cursor)
+        self.conn.commit()
+
+    def resume(self, chunks):
+        """Sauter les enregistrements déjà validés par une tentative précédente.
+
+        Les morceaux doivent être relus dans le même ordre à chaque tentative.
+        """
+        skip = self.resume_from
+        for chunk in chunks:
+            if skip >= len(chunk):
+                skip -= len(chunk)
+                self.position += len(chunk)
+                continue
+            self.position += skip
+            yield chunk[skip:]
+            skip = 0
+
+    def load(self, entries):
+        """Convertir et normaliser les enregistrements bruts un par un, puis les ajouter au lot courant."""
+        self._consume(normalize_entries(entries), len(entries))
+
+    def load_transformed(self, transformed, entries):
+        """Ajouter au lot courant un morceau normalisé par transform.transform_chunk."""
+        items = ((position, entries[position], record, reason) for position, record, reason in transformed)
+        self._consume(items, len(entries))
+
+    def _consume(self, items, count):
+        base = self.position
+        for position, entry, record, reason in items:
+            if reason is None and not record['journal_main']:
+                reason = 'Publication has no journal'
+            if reason is not None:
+                self.reject(base + position, entry, reason)
+                continue
+
+            record['key'] = publication_key(record)
+            record['hash'] = content_hash(record)
+            record['seq'] = base + position
+            record['entry'] = entry
+            self.pending.append(record)
+            self.done = record['seq'] + 1
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+        self.position = base + count
+
+    def reject(self, position, entry, reason):
+        """Mettre un enregistrement en quarantaine à la prochaine validation."""
+        title = entry.get('Title', '') if isinstance(entry, dict) else ''
+        logging.warning(f"Publication '{title}' rejected: {reason}")
+        self.rejected.append((position, entry, reason))
+        self.done = max(self.done, position + 1)
+
+    def flush(self):
+        """Écrire le lot courant; valider la transaction tous les `commit_every` lots."""
+        if not self.pending:
+            return
+
+        records, self.pending = self.pending, []
+        self.batches += 1
+
+        try:
+            counts = self._write(records)
+        except Exception as e:
+            self._recover(e, records)
+            return
+
+        self.uncommitted.append((self.batches, records, counts))
+        if len(self.uncommitted) >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        """Valider les lots écrits et les rejets depuis la dernière transaction."""
+        if not self.uncommitted and not self.rejected:
+            return
+        try:
+            self._commit()
+        except Exception as e:
+            self._recover(e)
+            return
+
+        for batch, records, (publication_count, quartil_count, unchanged_count) in self.uncommitted:
+            self.publications_loaded += publication_count
+            self.quartils_loaded += quartil_count
+            self.publications_unchanged += unchanged_count
+            logging.info(
+                f"Batch {batch}: {publication_count} publications, "
+                f"{quartil_count} quartils committed, {unchanged_count} unchanged publications skipped."
+            )
+        self.uncommitted = []
+
+    def finish(self):
+        """Écrire le dernier lot incomplet, valider la transaction en cours et supprimer le checkpoint."""
+        self.flush()
+        self.commit()
+        if self.checkpoint_key:
+            # Tâche terminée: une réexécution manuelle (clear) recharge tout
+            with self.conn.cursor() as cursor:
+                cursor.execute("DELETE FROM LoadCheckpoints WHERE CheckpointKey = %s", (self.checkpoint_key,))
+            self.conn.commit()
+        self.authors.log_stats()
+        self.journals.log_stats()
+        logging.info(
+            f"Loaded {self.publications_loaded} publications and {self.quartils_loaded} quartils "
+            f"in {self.batches} batches and {self.transactions} transactions, "
+            f"{self.publications_unchanged} unchanged publications skipped, "
+            f"{self.publications_rejected} records quarantined."
+        )
+        if self.resume_from:
+            logging.info(f"{self.resume_from} records committed by a previous attempt were skipped.")
+
+    def _changed(self, cursor, records):
+        """Retirer du lot les publications dont le contenu est déjà à jour dans l'entrepôt."""
+        latest = {record['key']: record for record in records}  # La dernière version l'emporte
+        placeholders = ', '.join(['%s'] * len(latest))
+        cursor.execute(
+            f"SELECT PublicationKey, ContentHash FROM Publications WHERE PublicationKey IN ({placeholders})",
+            list(latest)
+        )
+        stored = dict(cursor.fetchall())
+        return [record for key, record in latest.items() if stored.get(key) != record['hash']]
+
+    def _write(self, records):
+        with self.conn.cursor() as cursor:
+            with self.metrics.stage('insert') as stage:
+                changed = self._changed(cursor, records)
+                stage.count(rows_in=len(records))
+            unchanged_count = len(records) - len(changed)
+            records = changed
+            if not records:
+                return 0, 0, unchanged_count
+
+            with self.metrics.stage('resolve') as stage:
+                self.authors.resolve(cursor, (
+                    (name, (name,)) for record in records for name in record['authors']
+                ))
+                journal_ids = self.journals.resolve(cursor, (
+                    (record['journal_main'],
+                     (record['journal_main'], record['issn'], 'indexe' if record['indexed'] else 'pas indexe'))
+                    for record in records
+                ))
+                stage.count(rows_in=len(records), rows_out=len(records))
+
+            quartil_rows = []
+            publication_rows = []
+            for record in records:
+                journal_id = journal_ids[record['journal_main']]
+                for annee, quartil_value in record['quartils']:
+                    quartil_rows.append((annee, quartil_value, journal_id))
+                publication_rows.append((
+                    record['title'], record['doi'], record['publication_date'], record['link'],
+                    record['abstract'], journal_id, record['last_quartil'], record['key'], record['hash']
+                ))
+
+            with self.metrics.stage('insert') as stage:
+                if quartil_rows:
+                    cursor.executemany(INSERT_QUARTIL_SQL, quartil_rows)
+                cursor.executemany(UPSERT_PUBLICATION_SQL, publication_rows)
+                stage.count(rows_out=len(publication_rows))
+
+        return len(publication_rows), len(quartil_rows), unchanged_count
+
+    def _recover(self, error, failed_records=()):
+        """Annuler la transaction en cours et rejouer ses lots publication par publication.
+
+        Les publications qui échouent encore sont mises en quarantaine.
+        """
+        self._rollback()
+        records = [record for _, batch_records, _ in self.uncommitted for record in batch_records]
+        records.extend(failed_records)
+        self.uncommitted = []
+        logging.error(f"Transaction failed ({error}), retrying {len(records)} publications one by one.")
+
+        publication_count = quartil_count = 0
+        for record in records:
+            try:
+                written = self._write([record])
+                self._commit(record['seq'] + 1)
+            except Exception as e:
+                self._rollback()
+                self.reject(record['seq'], record['entry'], f"{type(e).__name__}: {e}")
+                continue
+            publication_count += written[0]
+            quartil_count += written[1]
+            self.publications_unchanged += written[2]
+
+        self.publications_loaded += publication_count
+        self.quartils_loaded += quartil_count
+        logging.info(f"Recovered {publication_count} publications, {quartil_count} quartils committed.")
+
+        try:
+            self._commit()
+        except Exception as e:
+            # Les rejets restent en mémoire et seront écrits à la prochaine validation
+            self._rollback()
+            logging.error(f"Could not quarantine rejected records: {e}")
+
+    def _commit(self, done=None):
+        """Valider la transaction avec les rejets et le checkpoint des enregistrements avant `done`."""
+        done = self.done if done is None else done
+        rejected = [item for item in self.rejected if item[0] < done]
+        with self.metrics.stage('commit'):
+            with self.conn.cursor() as cursor:
+                if rejected:
+                    write_quarantine(cursor, self.source, self.run_id,
+                                     [(entry, reason) for _, entry, reason in rejected])
+                if self.checkpoint_key:
+                    save_checkpoint(cursor, self.checkpoint_key, done)
+            self.conn.commit()
+        self.transactions += 1
+        self.publications_rejected += len(rejected)
+        self.rejected = [item for item in self.rejected if item[0] >= done]
+        self.authors.commit()
+        self.journals.commit()
+
+    def _rollback(self):
+        self.conn.rollback()
+        self.authors.rollback()
+        self.journals.rollback()
@@ -0,0 +1,237 @@
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+
+
+# Une ligne par étape et par tâche; les débits sont calculés sur les lignes en sortie
+CREATE_METRICS_SQL = """
+    CREATE TABLE IF NOT EXISTS PipelineStageMetrics (
+        MetricID BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        RunID VARCHAR(250),
+        TaskID VARCHAR(250),
+        Source VARCHAR(50),
+        Stage VARCHAR(50) NOT NULL,
+        WallSeconds DOUBLE NOT NULL,
+        RowsIn BIGINT NOT NULL,
+        RowsOut BIGINT NOT NULL,
+        Bytes BIGINT NOT NULL,
+        RoundTrips BIGINT NOT NULL,
+        RowsPerSecond DOUBLE,
+        CreatedAt TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        KEY (RunID)
+    )
+"""
+
+INSERT_METRICS_SQL = """
+    INSERT INTO PipelineStageMetrics (RunID, TaskID, Source, Stage, WallSeconds, RowsIn, RowsOut, Bytes,
+                                      RoundTrips, RowsPerSecond)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+STATSD_PREFIX = 'pipeline'
+
+
+class Stage:
+    """Compteurs cumulés d'une étape: durée, lignes en entrée et en sortie, octets, allers-retours base."""
+
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.rows_in = 0
+        self.rows_out = 0
+        self.bytes = 0
+        self.round_trips = 0
+
+    def count(self, rows_in=0, rows_out=0, bytes=0):
+        self.rows_in += rows_in
+        self.rows_out += rows_out
+        self.bytes += bytes
+
+    @property
+    def rows_per_second(self):
+        return self.rows_out / self.seconds if self.seconds > 0 and self.rows_out else None
+
+
+class PipelineMetrics:
+    """Instrumentation des étapes d'une tâche (extract, normalize, resolve, insert, ...).
+
+    Les durées sont cumulées par étape avec ``stage()``; une étape imbriquée
+    suspend le chronomètre de l'étape englobante, les durées ne se recouvrent
+    donc pas. Les allers-retours vers la base sont comptés par
+    ``instrument()`` et attribués à l'étape active la plus interne.
+    ``publish()`` écrit le résumé dans PipelineStageMetrics, au format StatsD
+    dans les logs et vers StatsD si les métriques Airflow sont activées.
+    """
+
+    def __init__(self, run_id=None, task_id=None, source=None):
+        self.run_id = run_id
+        self.task_id = task_id
+        self.source = source
+        self.stages = {}
+        self._active = []
+
+    def get(self, name):
+        if name not in self.stages:
+            self.stages[name] = Stage(name)
+        return self.stages[name]
+
+    @contextmanager
+    def stage(self, name):
+        """Chronométrer un bloc et cumuler sa durée dans l'étape `name`."""
+        stage = self.get(name)
+        now = time.perf_counter()
+        if self._active:
+            outer = self._active[-1]
+            outer[0].seconds += now - outer[1]
+        self._active.append([stage, now])
+        try:
+            yield stage
+        finally:
+            now = time.perf_counter()
+            stage.seconds += now - self._active.pop()[1]
+            if self._active:
+                self._active[-1][1] = now
+
+    def timed(self, name, chunks):
+        """Parcourir des morceaux en cumulant le temps d'obtention de chacun dans l'étape `name`."""
+        iterator = iter(chunks)
+        while True:
+            with self.stage(name) as stage:
+                chunk = next(iterator, None)
+                if chunk is not None:
+                    stage.count(rows_in=len(chunk), rows_out=len(chunk))
+            if chunk is None:
+                return
+            yield chunk
+
+    def round_trip(self):
+        if self._active:
+            self._active[-1][0].round_trips += 1
+
+    def instrument(self, conn):
+        """Connexion dont les curseurs comptent leurs requêtes comme allers-retours."""
+        return InstrumentedConnection(conn, self)
+
+    def stat_name(self, stage):
+        return '.'.join(part for part in (STATSD_PREFIX, self.source, stage.name) if part)
+
+    def statsd_lines(self):
+        """Résumé au format de ligne StatsD (``nom:valeur|type``)."""
+        lines = []
+        for stage in self.stages.values():
+            name = self.stat_name(stage)
+            lines.append(f'{name}.wall_time:{stage.seconds * 1000:.1f}|ms')
+            lines.append(f'{name}.rows_in:{stage.rows_in}|c')
+            lines.append(f'{name}.rows_out:{stage.rows_out}|c')
+            lines.append(f'{name}.bytes:{stage.bytes}|c')
+            lines.append(f'{name}.round_trips:{stage.round_trips}|c')
+            if stage.rows_per_second is not None:
+                lines.append(f'{name}.rows_per_second:{stage.rows_per_second:.1f}|g')
+        return lines
+
+    def log(self):
+        for stage in self.stages.values():
+            rate = f'{stage.rows_per_second:.0f} rows/s' if stage.rows_per_second is not None else 'n/a'
+            logging.info(
+                f"Stage '{stage.name}': {stage.seconds:.3f}s, {stage.rows_in} rows in, {stage.rows_out} rows out, "
+                f"{stage.bytes} bytes, {stage.round_trips} round trips, {rate}."
+            )
+        logging.info("StatsD lines:\n" + '\n'.join(self.statsd_lines()))
+
+    def publish(self, mysql_hook=None):
+        """Journaliser le résumé, l'envoyer à StatsD et l'écrire dans PipelineStageMetrics."""
+        if not self.stages:
+            return
+        self.log()
+        self._send_statsd()
+        if mysql_hook is None:
+            return
+        try:
+            conn = mysql_hook.get_conn()
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(CREATE_METRICS_SQL)
+                    cursor.executemany(INSERT_METRICS_SQL, [
+                        (self.run_id, self.task_id, self.source, stage.name, stage.seconds, stage.rows_in,
+                         stage.rows_out, stage.bytes, stage.round_trips, stage.rows_per_second)
+                        for stage in self.stages.values()
+                    ])
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            # Les métriques ne doivent jamais faire échouer un chargement
+            logging.warning(f"Could not write pipeline metrics: {e}")
+
+    def _send_statsd(self):
+        try:
+            from airflow.stats import Stats
+        except ImportError:
+            return
+        # Stats est sans effet si [metrics] statsd_on n'est pas activé
+        for stage in self.stages.values():
+            name = self.stat_name(stage)
+            Stats.timing(f'{name}.wall_time', stage.seconds * 1000)
+            Stats.incr(f'{name}.rows_in', stage.rows_in)
+            Stats.incr(f'{name}.rows_out', stage.rows_out)
+            Stats.incr(f'{name}.bytes', stage.bytes)
+            Stats.incr(f'{name}.round_trips', stage.round_trips)
+            if stage.rows_per_second is not None:
+                Stats.gauge(f'{name}.rows_per_second', stage.rows_per_second)
+
+
+class InstrumentedConnection:
+    """Enveloppe d'une connexion DB-API qui compte les requêtes de ses curseurs."""
+
+    def __init__(self, conn, metrics):
+        self._conn = conn
+        self._metrics = metrics
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs), self._metrics)
+
+    def commit(self):
+        self._metrics.round_trip()
+        self._conn.commit()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class InstrumentedCursor:
+    def __init__(self, cursor, metrics):
+        self._cursor = cursor
+        self._metrics = metrics
+
+    def __enter__(self):
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._cursor.__exit__(*exc_info)
+
+    def execute(self, *args, **kwargs):
+        self._metrics.round_trip()
+        return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        # MySQLdb regroupe les INSERT ... VALUES en une requête multi-lignes
+        self._metrics.round_trip()
+        return self._cursor.executemany(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+def sample_payload(stage, records, rate):
+    """Journaliser une fraction `rate` des enregistrements (débogage, désactivé par défaut)."""
+    if not rate:
+        return
+    for record in records:
+        if random.random() < rate:
+            logging.info(f"Sample from '{stage}': {json.dumps(record, indent=4, default=str)}")
@@ -0,0 +1,60 @@
+import json
+import logging
+
+
+# Enregistrements rejetés par le chargeur, avec la raison du rejet; ils sont
+# rejoués en masse par la tâche replay_quarantined_records
+CREATE_QUARANTINE_SQL = """
+    CREATE TABLE IF NOT EXISTS LoadQuarantine (
+        QuarantineID BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        Source VARCHAR(50) NOT NULL,
+        RunID VARCHAR(250),
+        Reason TEXT NOT NULL,
+        Record LONGTEXT NOT NULL,
+        CreatedAt TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        ReplayedAt TIMESTAMP NULL,
+        KEY (Source, ReplayedAt)
+    )
+"""
+
+INSERT_QUARANTINE_SQL = "INSERT INTO LoadQuarantine (Source, RunID, Reason, Record) VALUES (%s, %s, %s, %s)"
+
+
+def ensure_quarantine(cursor):
+    cursor.execute(CREATE_QUARANTINE_SQL)
+
+
+def write_quarantine(cursor, source, run_id, rejected):
+    """Écrire les paires (enregistrement brut, raison) rejetées."""
+    cursor.executemany(INSERT_QUARANTINE_SQL, [
+        (source, run_id, reason[:65535], json.dumps(entry, default=str))
+        for entry, reason in rejected
+    ])
+    logging.warning(f"{len(rejected)} records from '{source}' quarantined.")
+
+
+def pending_quarantine(cursor):
+    """{source: plus grand ID} des enregistrements pas encore rejoués."""
+    cursor.execute("SELECT Source, MAX(QuarantineID) FROM LoadQuarantine WHERE ReplayedAt IS NULL GROUP BY Source")
+    return dict(cursor.fetchall())
+
+
+def fetch_quarantine(cursor, source, after_id, last_id, limit=1000):
+    """Page suivante des enregistrements de `source` pas encore rejoués, d'ID dans ]after_id, last_id].
+
+    La borne `last_id` exclut les enregistrements remis en quarantaine pendant le rejeu.
+    Retourne [(ID, enregistrement brut)].
+    """
+    cursor.execute(
+        "SELECT QuarantineID, Record FROM LoadQuarantine "
+        "WHERE Source = %s AND ReplayedAt IS NULL AND QuarantineID > %s AND QuarantineID <= %s "
+        "ORDER BY QuarantineID LIMIT %s",
+        (source, after_id, last_id, limit)
+    )
+    return [(row[0], json.loads(row[1])) for row in cursor.fetchall()]
+
+
+def mark_replayed(cursor, ids):
+    placeholders = ', '.join(['%s'] * len(ids))
+    cursor.execute(f"UPDATE LoadQuarantine SET ReplayedAt = CURRENT_TIMESTAMP WHERE QuarantineID IN ({placeholders})",
+                   list(ids))
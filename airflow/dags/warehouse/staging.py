@@ -0,0 +1,95 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+
+
+# Répertoire local ou partagé (volume commun aux workers) des fichiers intermédiaires
+DEFAULT_STAGING_DIR = os.environ.get('PIPELINE_STAGING_DIR', '/opt/airflow/staging')
+
+STAGING_FORMAT = 'ndjson.gz'
+
+
+def staging_path(staging_dir, run_id, source):
+    """Répertoire des fichiers d'une source pour une exécution du DAG."""
+    safe_run_id = re.sub(r'[^A-Za-z0-9_.-]', '_', run_id)
+    return os.path.join(staging_dir, safe_run_id, source)
+
+
+def write_chunks(chunks, directory, schema=None):
+    """Écrire chaque morceau dans un fichier NDJSON compressé et retourner le manifeste.
+
+    Seul le manifeste (chemins, nombre de lignes et d'octets, schéma, sommes de contrôle)
+    transite par XCom; les enregistrements restent sur disque.
+    """
+    os.makedirs(directory, exist_ok=True)
+    files = []
+    fields = set()
+    for index, chunk in enumerate(chunks):
+        path = os.path.join(directory, f'part-{index:05d}.{STAGING_FORMAT}')
+        with gzip.open(path, 'wt', encoding='utf-8') as file:
+            for record in chunk:
+                file.write(json.dumps(record, default=str))
+                file.write('\n')
+                if schema is None and isinstance(record, dict):
+                    fields.update(record)
+        files.append({'path': path, 'rows': len(chunk), 'bytes': os.path.getsize(path),
+                      'sha256': file_checksum(path)})
+
+    manifest = {
+        'format': STAGING_FORMAT,
+        'directory': directory,
+        'files': files,
+        'rows': sum(file['rows'] for file in files),
+        'schema': list(schema) if schema is not None else sorted(fields),
+    }
+    logging.info(f"Staged {manifest['rows']} records in {len(files)} files under {directory}.")
+    return manifest
+
+
+def read_chunks(manifest):
+    """Relire les morceaux d'un manifeste un fichier à la fois, en vérifiant leur somme de contrôle."""
+    for file in manifest['files']:
+        with open(file['path'], 'rb') as raw:
+            content = raw.read()
+        if hashlib.sha256(content).hexdigest() != file['sha256']:
+            raise ValueError(f"Checksum mismatch for staged file {file['path']}")
+        lines = gzip.decompress(content).decode('utf-8').splitlines()
+        yield [json.loads(line) for line in lines if line]
+
+
+def split_manifest(manifest, partitions):
+    """Répartir les fichiers d'un manifeste en au plus `partitions` manifestes contigus."""
+    files = manifest['files']
+    if not files:
+        return []
+
+    size = -(-len(files) // max(1, partitions))  # Arrondi supérieur
+    result = []
+    for start in range(0, len(files), size):
+        part = files[start:start + size]
+        result.append(dict(manifest, files=part, rows=sum(file['rows'] for file in part)))
+    return result
+
+
+def remove_staged(manifest):
+    """Supprimer les fichiers d'un manifeste, puis son répertoire s'il est vide."""
+    for file in manifest['files']:
+        try:
+            os.remove(file['path'])
+        except FileNotFoundError:
+            pass
+    try:
+        os.rmdir(manifest['directory'])
+    except OSError:
+        pass  # D'autres partitions de la source n'ont pas encore été chargées
+
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
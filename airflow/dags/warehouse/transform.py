@@ -0,0 +1,43 @@
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from warehouse.loader import normalize_entries
+
+
+DEFAULT_TRANSFORM_WORKERS = 1
+
+# Morceaux en cours de transformation par processus: borne la mémoire quand
+# l'écriture est plus lente que la transformation
+IN_FLIGHT_PER_WORKER = 2
+
+
+def transform_chunk(chunk):
+    """Normaliser un morceau: [(position, publication normalisée ou None, raison du rejet)].
+
+    Exécuté dans les processus de travail; les enregistrements bruts ne sont pas
+    renvoyés au processus principal, qui les retrouve par leur position.
+    """
+    return [(position, record, reason) for position, _, record, reason in normalize_entries(chunk)]
+
+
+def transform_parallel(chunks, workers):
+    """Normaliser les morceaux sur `workers` processus et les produire dans l'ordre d'entrée.
+
+    Produit (morceau, résultat de transform_chunk); le chargeur reste l'unique
+    écrivain dans le processus principal.
+    """
+    # "spawn": le processus de la tâche Airflow a des threads (heartbeat), un fork serait fragile
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        in_flight = deque()
+        for chunk in chunks:
+            in_flight.append((chunk, executor.submit(transform_chunk, chunk)))
+            if len(in_flight) >= workers * IN_FLIGHT_PER_WORKER:
+                chunk, future = in_flight.popleft()
+                yield chunk, future.result()
+        while in_flight:
+            chunk, future = in_flight.popleft()
+            yield chunk, future.result()
+    logging.info(f"Transformed chunks on {workers} worker processes.")
@@ -0,0 +1,21 @@
+import logging
+
+from airflow.models import Variable
+
+
+def variable_key(source):
+    return f'pipeline_watermark_{source}'
+
+
+def get_watermark(source, field):
+    """Retourner le dernier watermark validé de `source` (valeur encodée), ou None."""
+    state = Variable.get(variable_key(source), default_var=None, deserialize_json=True)
+    if not state or state.get('field') != field:
+        # Pas encore de watermark, ou le champ a changé: extraction complète
+        return None
+    return state.get('value')
+
+
+def set_watermark(source, field, value):
+    Variable.set(variable_key(source), {'field': field, 'value': value}, serialize_json=True)
+    logging.info(f"Watermark for '{source}' advanced to {field} = {value}.")